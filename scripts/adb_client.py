@@ -0,0 +1,184 @@
+import asyncio
+import socket
+import struct
+
+
+class AdbError(Exception):
+    pass
+
+
+SHELL_STDIN = 0
+SHELL_STDOUT = 1
+SHELL_STDERR = 2
+SHELL_EXIT = 3
+SHELL_CLOSE_STDIN = 4
+
+
+def encode_request(request):
+    data = request.encode("utf-8")
+    return f"{len(data):04x}".encode("ascii") + data
+
+
+async def read_exact(reader, size):
+    try:
+        return await reader.readexactly(size)
+    except asyncio.IncompleteReadError:
+        raise AdbError("Connection closed by the adb server")
+
+
+async def read_status(reader):
+    status = await read_exact(reader, 4)
+    if status == b"OKAY":
+        return
+    if status == b"FAIL":
+        size = int(await read_exact(reader, 4), 16)
+        raise AdbError((await read_exact(reader, size)).decode("utf-8", errors="replace"))
+    raise AdbError(f"Unexpected response from the adb server: {status!r}")
+
+
+class AdbConnection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.writer.close()
+
+
+class AdbClient:
+    # speaks the adb server smart-socket protocol directly, see SERVICES.TXT and SYNC.TXT in the adb sources
+    def __init__(self, host="127.0.0.1", port=5037, timeout=30):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.features = {}
+        self.sync_connections = {}
+        self.sync_locks = {}
+
+    async def connect(self):
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+        writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return AdbConnection(reader, writer)
+
+    async def request(self, conn, request):
+        conn.writer.write(encode_request(request))
+        await conn.writer.drain()
+        await read_status(conn.reader)
+
+    async def host_request(self, request):
+        async with await self.connect() as conn:
+            await self.request(conn, request)
+            size = int(await read_exact(conn.reader, 4), 16)
+            return (await read_exact(conn.reader, size)).decode("utf-8")
+
+    async def devices(self):
+        result = await self.host_request("host:devices")
+        return [line.split()[0] for line in result.splitlines() if line.strip()]
+
+    async def get_features(self, serial):
+        if serial not in self.features:
+            self.features[serial] = set((await self.host_request(f"host-serial:{serial}:features")).split(","))
+        return self.features[serial]
+
+    async def open_service(self, serial, service):
+        conn = await self.connect()
+        try:
+            await self.request(conn, f"host:transport:{serial}")
+            await self.request(conn, service)
+        except (AdbError, OSError):
+            conn.close()
+            raise
+        return conn
+
+    async def shell(self, serial, command):
+        if "shell_v2" not in await self.get_features(serial):
+            return await self.shell_legacy(serial, command)
+        stdout, stderr = [], []
+        returncode = None
+        async with await self.open_service(serial, f"shell,v2,raw:{command}") as conn:
+            while returncode is None:
+                packet_id, size = struct.unpack("<BI", await read_exact(conn.reader, 5))
+                data = await read_exact(conn.reader, size)
+                if packet_id == SHELL_STDOUT:
+                    stdout.append(data)
+                elif packet_id == SHELL_STDERR:
+                    stderr.append(data)
+                elif packet_id == SHELL_EXIT:
+                    returncode = data[0]
+        return returncode, b"".join(stdout), b"".join(stderr)
+
+    async def shell_legacy(self, serial, command):
+        # the legacy shell service merges stderr into stdout and does not report the exit code, so the exit code is
+        # echoed after the command output instead
+        marker = b"__appagent_exit__"
+        service = f"shell:{command}; __rc=$?; echo; echo {marker.decode()} $__rc"
+        async with await self.open_service(serial, service) as conn:
+            output = await conn.reader.read()
+        output, found, status = output.rpartition(marker)
+        if not found or not status.split() or not status.split()[0].isdigit():
+            raise AdbError("Exit code missing from the legacy shell output")
+        return int(status.split()[0]), output.rstrip(b"\r\n"), b""
+
+    async def exec_out(self, serial, command):
+        async with await self.open_service(serial, f"exec:{command}") as conn:
+            return await conn.reader.read()
+
+    async def _sync_connection(self, serial):
+        if serial not in self.sync_connections:
+            self.sync_connections[serial] = await self.open_service(serial, "sync:")
+        return self.sync_connections[serial]
+
+    async def _recv_file(self, conn, remote_path):
+        path = remote_path.encode("utf-8")
+        conn.writer.write(b"RECV" + struct.pack("<I", len(path)) + path)
+        await conn.writer.drain()
+        chunks = []
+        while True:
+            response, size = struct.unpack("<4sI", await read_exact(conn.reader, 8))
+            if response == b"DATA":
+                chunks.append(await read_exact(conn.reader, size))
+            elif response == b"DONE":
+                return b"".join(chunks)
+            elif response == b"FAIL":
+                raise AdbError((await read_exact(conn.reader, size)).decode("utf-8", errors="replace"))
+            else:
+                raise AdbError(f"Unexpected sync response from the adb server: {response!r}")
+
+    async def pull_bytes(self, serial, remote_path):
+        # the sync service keeps the connection open between transfers, so one connection per device is reused and
+        # only re-opened when the cached one turns out to be stale. Transfers on one connection are serialized, the
+        # devices each have their own connection and lock so pulls from different devices run concurrently
+        async with self.sync_locks.setdefault(serial, asyncio.Lock()):
+            for attempt in range(2):
+                reused = serial in self.sync_connections
+                try:
+                    return await self._recv_file(await self._sync_connection(serial), remote_path)
+                except (AdbError, OSError):
+                    self.close_sync(serial)
+                    if not reused or attempt:
+                        raise
+
+    async def pull(self, serial, remote_path, local_path):
+        data = await self.pull_bytes(serial, remote_path)
+        with open(local_path, "wb") as f:
+            f.write(data)
+        return len(data)
+
+    def close_sync(self, serial):
+        conn = self.sync_connections.pop(serial, None)
+        if conn is not None:
+            try:
+                conn.writer.write(b"QUIT" + struct.pack("<I", 0))
+            except OSError:
+                pass
+            conn.close()
+
+    def close(self):
+        for serial in list(self.sync_connections):
+            self.close_sync(serial)
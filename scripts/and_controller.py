@@ -1,185 +1,864 @@
-import os
-import subprocess
-import xml.etree.ElementTree as ET
-
-from config import load_config
-from utils import print_with_color
-
-
-configs = load_config()
-
-
-class AndroidElement:
-    def __init__(self, uid, bbox, attrib):
-        self.uid = uid
-        self.bbox = bbox
-        self.attrib = attrib
-
-
-def execute_adb(adb_command):
-    # print(adb_command)
-    result = subprocess.run(adb_command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    if result.returncode == 0:
-        return result.stdout.strip()
-    print_with_color(f"Command execution failed: {adb_command}", "red")
-    print_with_color(result.stderr, "red")
-    return "ERROR"
-
-
-def list_all_devices():
-    adb_command = "adb devices"
-    device_list = []
-    result = execute_adb(adb_command)
-    if result != "ERROR":
-        devices = result.split("\n")[1:]
-        for d in devices:
-            device_list.append(d.split()[0])
-
-    return device_list
-
-
-def get_id_from_element(elem):
-    bounds = elem.attrib["bounds"][1:-1].split("][")
-    x1, y1 = map(int, bounds[0].split(","))
-    x2, y2 = map(int, bounds[1].split(","))
-    elem_w, elem_h = x2 - x1, y2 - y1
-    if "resource-id" in elem.attrib and elem.attrib["resource-id"]:
-        elem_id = elem.attrib["resource-id"].replace(":", ".").replace("/", "_")
-    else:
-        elem_id = f"{elem.attrib['class']}_{elem_w}_{elem_h}"
-    if "content-desc" in elem.attrib and elem.attrib["content-desc"] and len(elem.attrib["content-desc"]) < 20:
-        content_desc = elem.attrib['content-desc'].replace("/", "_").replace(" ", "").replace(":", "_")
-        elem_id += f"_{content_desc}"
-    return elem_id
-
-
-def traverse_tree(xml_path, elem_list, attrib, add_index=False):
-    path = []
-    for event, elem in ET.iterparse(xml_path, ['start', 'end']):
-        if event == 'start':
-            path.append(elem)
-            if attrib in elem.attrib and elem.attrib[attrib] == "true":
-                parent_prefix = ""
-                if len(path) > 1:
-                    parent_prefix = get_id_from_element(path[-2])
-                bounds = elem.attrib["bounds"][1:-1].split("][")
-                x1, y1 = map(int, bounds[0].split(","))
-                x2, y2 = map(int, bounds[1].split(","))
-                center = (x1 + x2) // 2, (y1 + y2) // 2
-                elem_id = get_id_from_element(elem)
-                if parent_prefix:
-                    elem_id = parent_prefix + "_" + elem_id
-                if add_index:
-                    elem_id += f"_{elem.attrib['index']}"
-                close = False
-                for e in elem_list:
-                    bbox = e.bbox
-                    center_ = (bbox[0][0] + bbox[1][0]) // 2, (bbox[0][1] + bbox[1][1]) // 2
-                    dist = (abs(center[0] - center_[0]) ** 2 + abs(center[1] - center_[1]) ** 2) ** 0.5
-                    if dist <= configs["MIN_DIST"]:
-                        close = True
-                        break
-                if not close:
-                    elem_list.append(AndroidElement(elem_id, ((x1, y1), (x2, y2)), attrib))
-
-        if event == 'end':
-            path.pop()
-
-
-class AndroidController:
-    def __init__(self, device):
-        self.device = device
-        self.screenshot_dir = configs["ANDROID_SCREENSHOT_DIR"]
-        self.xml_dir = configs["ANDROID_XML_DIR"]
-        self.width, self.height = self.get_device_size()
-        self.backslash = "\\"
-
-    def get_device_size(self):
-        adb_command = f"adb -s {self.device} shell wm size"
-        result = execute_adb(adb_command)
-        if result != "ERROR":
-            return map(int, result.split(": ")[1].split("x"))
-        return 0, 0
-
-    def get_screenshot(self, prefix, save_dir):
-        cap_command = f"adb -s {self.device} shell screencap -p " \
-                      f"{os.path.join(self.screenshot_dir, prefix + '.png').replace(self.backslash, '/')}"
-        pull_command = f"adb -s {self.device} pull " \
-                       f"{os.path.join(self.screenshot_dir, prefix + '.png').replace(self.backslash, '/')} " \
-                       f"{os.path.join(save_dir, prefix + '.png')}"
-        result = execute_adb(cap_command)
-        if result != "ERROR":
-            result = execute_adb(pull_command)
-            if result != "ERROR":
-                return os.path.join(save_dir, prefix + ".png")
-            return result
-        return result
-
-    def get_xml(self, prefix, save_dir):
-        dump_command = f"adb -s {self.device} shell uiautomator dump " \
-                       f"{os.path.join(self.xml_dir, prefix + '.xml').replace(self.backslash, '/')}"
-        pull_command = f"adb -s {self.device} pull " \
-                       f"{os.path.join(self.xml_dir, prefix + '.xml').replace(self.backslash, '/')} " \
-                       f"{os.path.join(save_dir, prefix + '.xml')}"
-        result = execute_adb(dump_command)
-        if result != "ERROR":
-            result = execute_adb(pull_command)
-            if result != "ERROR":
-                return os.path.join(save_dir, prefix + ".xml")
-            return result
-        return result
-
-    def back(self):
-        adb_command = f"adb -s {self.device} shell input keyevent KEYCODE_BACK"
-        ret = execute_adb(adb_command)
-        return ret
-
-    def tap(self, x, y):
-        adb_command = f"adb -s {self.device} shell input tap {x} {y}"
-        ret = execute_adb(adb_command)
-        return ret
-
-    def text(self, input_str):
-        input_str = input_str.replace(" ", "%s")
-        input_str = input_str.replace("'", "")
-        adb_command = f"adb -s {self.device} shell input text {input_str}"
-        ret = execute_adb(adb_command)
-        return ret
-
-    def enter(self):
-        adb_command = f"adb -s {self.device} shell input keyevent KEYCODE_ENTER"
-        ret = execute_adb(adb_command)
-        return ret
-
-    def long_press(self, x, y, duration=1000):
-        adb_command = f"adb -s {self.device} shell input swipe {x} {y} {x} {y} {duration}"
-        ret = execute_adb(adb_command)
-        return ret
-
-    def swipe(self, x, y, direction, dist="medium", quick=False):
-        unit_dist = int(self.width / 10)
-        if dist == "long":
-            unit_dist *= 3
-        elif dist == "medium":
-            unit_dist *= 2
-        if direction == "up":
-            offset = 0, -2 * unit_dist
-        elif direction == "down":
-            offset = 0, 2 * unit_dist
-        elif direction == "left":
-            offset = -1 * unit_dist, 0
-        elif direction == "right":
-            offset = unit_dist, 0
-        else:
-            return "ERROR"
-        duration = 100 if quick else 400
-        adb_command = f"adb -s {self.device} shell input swipe {x} {y} {x+offset[0]} {y+offset[1]} {duration}"
-        ret = execute_adb(adb_command)
-        return ret
-
-    def swipe_precise(self, start, end, duration=400):
-        start_x, start_y = start
-        end_x, end_y = end
-        adb_command = f"adb -s {self.device} shell input swipe {start_x} {start_x} {end_x} {end_y} {duration}"
-        ret = execute_adb(adb_command)
-        return ret
+import asyncio
+import hashlib
+import os
+import re
+import struct
+import tempfile
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from xml.parsers import expat
+
+import cv2
+import numpy as np
+
+from adb_client import AdbClient, AdbError
+from config import load_config
+from utils import print_with_color, run_sync, save_file_async, MemoryImage
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+configs = load_config()
+
+
+class AndroidElement:
+    # a view of one row of an ElementTable, the geometry is read from the table columns on access
+    __slots__ = ("uid", "table", "row", "attrib")
+
+    def __init__(self, uid, table, row, attrib):
+        self.uid = uid
+        self.table = table
+        self.row = row
+        self.attrib = attrib
+
+    @property
+    def bbox(self):
+        t, i = self.table, self.row
+        return (int(t.x1[i]), int(t.y1[i])), (int(t.x2[i]), int(t.y2[i]))
+
+    @property
+    def center(self):
+        return int(self.table.center[self.row, 0]), int(self.table.center[self.row, 1])
+
+    @property
+    def area(self):
+        return int(self.table.area[self.row])
+
+    def has_flag(self, attrib):
+        return bool(self.table.flags[self.row] & FLAGS[attrib])
+
+
+async def execute_adb_async(adb_command, binary=False):
+    proc = await asyncio.create_subprocess_shell(adb_command, stdout=asyncio.subprocess.PIPE,
+                                                 stderr=asyncio.subprocess.PIPE)
+    stdout, stderr = await proc.communicate()
+    if proc.returncode == 0:
+        return stdout if binary else stdout.decode("utf-8", errors="replace").replace("\r\n", "\n").strip()
+    print_with_color(f"Command execution failed: {adb_command}", "red")
+    print_with_color(stderr.decode("utf-8", errors="replace"), "red")
+    return "ERROR"
+
+
+def execute_adb(adb_command):
+    return run_sync(execute_adb_async(adb_command))
+
+
+async def list_all_devices_async():
+    if configs["ADB_BACKEND"] == "socket":
+        try:
+            return await AdbClient(configs["ADB_SERVER_HOST"], configs["ADB_SERVER_PORT"]).devices()
+        except (AdbError, OSError) as e:
+            print_with_color(f"Failed to list devices from the adb server: {e}", "red")
+            return []
+    adb_command = "adb devices"
+    device_list = []
+    result = await execute_adb_async(adb_command)
+    if result != "ERROR":
+        devices = result.split("\n")[1:]
+        for d in devices:
+            device_list.append(d.split()[0])
+
+    return device_list
+
+
+def list_all_devices():
+    return run_sync(list_all_devices_async())
+
+
+BOUNDS_PATTERN = re.compile(r"\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]")
+
+
+def parse_bounds(bounds):
+    x1, y1, x2, y2 = BOUNDS_PATTERN.match(bounds).groups()
+    return int(x1), int(y1), int(x2), int(y2)
+
+
+def get_id_from_attrib(attrib, bounds=None):
+    x1, y1, x2, y2 = bounds or parse_bounds(attrib["bounds"])
+    elem_w, elem_h = x2 - x1, y2 - y1
+    if "resource-id" in attrib and attrib["resource-id"]:
+        elem_id = attrib["resource-id"].replace(":", ".").replace("/", "_")
+    else:
+        elem_id = f"{attrib['class']}_{elem_w}_{elem_h}"
+    if "content-desc" in attrib and attrib["content-desc"] and len(attrib["content-desc"]) < 20:
+        content_desc = attrib['content-desc'].replace("/", "_").replace(" ", "").replace(":", "_")
+        elem_id += f"_{content_desc}"
+    return elem_id
+
+
+def get_id_from_element(elem):
+    return get_id_from_attrib(elem.attrib)
+
+
+def iter_xml_events(xml):
+    # xml can be a file path, a file-like object or the raw bytes returned by AndroidController.get_xml_bytes
+    if isinstance(xml, (bytes, bytearray)):
+        parser = ET.XMLPullParser(['start', 'end'])
+        parser.feed(xml)
+        parser.close()
+        return parser.read_events()
+    return ET.iterparse(xml, ['start', 'end'])
+
+
+def strip_uiautomator_trailer(data):
+    # uiautomator appends "UI hierchary dumped to: <file>" after the document when dumping to stdout
+    end = data.rfind(b"</hierarchy>")
+    if end < 0:
+        return None
+    start = data.find(b"<?xml")
+    return data[max(start, 0):end + len(b"</hierarchy>")]
+
+
+class SpatialGrid:
+    # uniform grid over element centers with cells as large as the query distance, so every point within that
+    # distance of a center lies in the 3x3 block of cells around it and a neighbor query is O(1) on average
+    def __init__(self, cell_size):
+        self.cell_size = max(cell_size, 1)
+        self.cells = {}
+
+    def get_cell(self, point):
+        return int(point[0] // self.cell_size), int(point[1] // self.cell_size)
+
+    def add(self, point):
+        self.cells.setdefault(self.get_cell(point), []).append(point)
+
+    def has_neighbor(self, point, dist):
+        cx, cy = self.get_cell(point)
+        for x in (cx - 1, cx, cx + 1):
+            for y in (cy - 1, cy, cy + 1):
+                for other in self.cells.get((x, y), ()):
+                    if (point[0] - other[0]) ** 2 + (point[1] - other[1]) ** 2 <= dist * dist:
+                        return True
+        return False
+
+
+def dedup_points(points, accepted=(), min_dist=None):
+    # returns the positions of the points, in order, that are farther than min_dist (MIN_DIST by default) from all
+    # accepted points and from the points kept before them
+    min_dist = configs["MIN_DIST"] if min_dist is None else min_dist
+    grid = SpatialGrid(min_dist)
+    for point in accepted:
+        grid.add(point)
+    kept = []
+    for i, point in enumerate(points):
+        if not grid.has_neighbor(point, min_dist):
+            grid.add(point)
+            kept.append(i)
+    return kept
+
+
+def dedup_elements(candidates, accepted=(), min_dist=None):
+    # same as dedup_points on the element centers
+    kept = dedup_points([elem.center for elem in candidates], [elem.center for elem in accepted], min_dist)
+    return [candidates[i] for i in kept]
+
+
+INTERACTIVE_ATTRIBS = ("clickable", "focusable", "long-clickable", "scrollable", "checkable")
+FLAGS = {attrib: 1 << i for i, attrib in enumerate(INTERACTIVE_ATTRIBS)}
+# the state of an element that an action can toggle without moving it or changing its text, e.g. a switch
+STATE_ATTRIBS = ("checked", "selected", "enabled")
+STATES = {attrib: 1 << i for i, attrib in enumerate(STATE_ATTRIBS)}
+
+
+class ElementTable:
+    # every interactive node of one UI hierarchy in document order, built by a single pass of parse_ui_hierarchy and
+    # shared by the executors. The geometry is kept as int32 columns so it can be queried for the whole screen at
+    # once, the elements handed out are AndroidElement views of a row
+    def __init__(self, uids, indices, boxes, flags, texts=None, structure_hash=None, content_hash=None, states=None):
+        self.uids = uids
+        self.indices = indices
+        self.texts = texts if texts is not None else [""] * len(uids)
+        boxes = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+        self.x1, self.y1, self.x2, self.y2 = boxes.T
+        self.center = np.stack([(self.x1 + self.x2) // 2, (self.y1 + self.y2) // 2], axis=1)
+        self.area = (self.x2 - self.x1) * (self.y2 - self.y1)
+        self.flags = np.asarray(flags, dtype=np.uint8)
+        self.states = np.asarray(states if states is not None else [0] * len(uids), dtype=np.uint8)
+        self.structure_hash = structure_hash
+        self.content_hash = content_hash
+
+    def __len__(self):
+        return len(self.uids)
+
+    def take(self, rows):
+        rows = np.asarray(rows, dtype=np.intp).reshape(-1)
+        boxes = np.stack([self.x1[rows], self.y1[rows], self.x2[rows], self.y2[rows]], axis=1)
+        return ElementTable([self.uids[i] for i in rows], [self.indices[i] for i in rows], boxes, self.flags[rows],
+                            [self.texts[i] for i in rows], states=self.states[rows])
+
+    def has_flag(self, attrib):
+        return (self.flags & FLAGS[attrib]) != 0
+
+    def distance_matrix(self, rows=None, other_rows=None):
+        # Euclidean distances between the centers of two sets of rows, every row by default
+        a = self.center if rows is None else self.center[rows]
+        b = self.center if other_rows is None else self.center[other_rows]
+        diff = a[:, None, :].astype(np.float64) - b[None, :, :]
+        return np.sqrt((diff ** 2).sum(axis=2))
+
+    def contains_point(self, x, y):
+        return (self.x1 <= x) & (x <= self.x2) & (self.y1 <= y) & (y <= self.y2)
+
+    def containment_matrix(self):
+        # entry [i, j] tells whether the bounds of row i enclose the bounds of row j
+        return ((self.x1[:, None] <= self.x1[None, :]) & (self.y1[:, None] <= self.y1[None, :]) &
+                (self.x2[:, None] >= self.x2[None, :]) & (self.y2[:, None] >= self.y2[None, :]))
+
+    def clip(self, width, height):
+        # bounds clipped to the screen and the rows that are still visible afterwards
+        x1, x2 = np.clip(self.x1, 0, width), np.clip(self.x2, 0, width)
+        y1, y2 = np.clip(self.y1, 0, height), np.clip(self.y2, 0, height)
+        visible = np.flatnonzero((x2 > x1) & (y2 > y1))
+        boxes = np.stack([x1, y1, x2, y2], axis=1)[visible]
+        return ElementTable([self.uids[i] for i in visible], [self.indices[i] for i in visible], boxes,
+                            self.flags[visible], [self.texts[i] for i in visible], states=self.states[visible]), visible
+
+    def argsort(self, key="area", descending=False):
+        values = {"area": self.area, "x": self.center[:, 0], "y": self.center[:, 1]}[key]
+        return np.argsort(-values if descending else values, kind="stable")
+
+    def get_uid(self, row, add_index=True):
+        return f"{self.uids[row]}_{self.indices[row]}" if add_index else self.uids[row]
+
+    def get_elements(self, attrib, add_index=True, elem_list=None):
+        # same result as traverse_tree, elements closer than MIN_DIST to an element already in the list are dropped
+        elem_list = [] if elem_list is None else elem_list
+        rows = np.flatnonzero(self.has_flag(attrib))
+        kept = dedup_points(self.center[rows].tolist(), [elem.center for elem in elem_list])
+        elem_list.extend(AndroidElement(self.get_uid(row, add_index), self, row, attrib) for row in rows[kept].tolist())
+        return elem_list
+
+    def get_elem_list(self, excluded=()):
+        # the clickable elements followed by the focusable ones that do not overlap any of them, elements whose uid is
+        # in excluded are left out but still suppress the focusable elements next to them
+        clickable_list = self.get_elements("clickable")
+        focusable_list = self.get_elements("focusable")
+        elem_list = [elem for elem in clickable_list if elem.uid not in excluded]
+        elem_list.extend(dedup_elements([elem for elem in focusable_list if elem.uid not in excluded], clickable_list))
+        return elem_list
+
+
+class HierarchyBuilder:
+    # builds the element table while a parser backend reports the start and end of every node, in the parser target
+    # interface of ElementTree and lxml. Nodes that are not interactive are only pushed on the path, and the bounds and
+    # id of a node are computed at most once even when it is also the parent of interactive nodes
+    def __init__(self):
+        self.uids, self.indices, self.boxes, self.flags, self.texts, self.states = [], [], [], [], [], []
+        self.path = []
+
+    def start(self, tag, attrib):
+        get = attrib.get
+        elem_flags = (get("clickable") == "true") | (get("focusable") == "true") << 1 | \
+            (get("long-clickable") == "true") << 2 | (get("scrollable") == "true") << 3 | \
+            (get("checkable") == "true") << 4
+        self.path.append([attrib, None])
+        if elem_flags:
+            bounds = parse_bounds(attrib["bounds"])
+            elem_id = self.path[-1][1] = get_id_from_attrib(attrib, bounds)
+            if len(self.path) > 1:
+                elem_id = self.get_path_id(-2) + "_" + elem_id
+            self.uids.append(elem_id)
+            self.indices.append(get("index"))
+            self.boxes.extend(bounds)
+            self.flags.append(elem_flags)
+            self.texts.append(get("text", ""))
+            self.states.append((get("checked") == "true") | (get("selected") == "true") << 1 |
+                               (get("enabled") == "true") << 2)
+
+    def end(self, tag):
+        self.path.pop()
+
+    def get_path_id(self, i):
+        if self.path[i][1] is None:
+            self.path[i][1] = get_id_from_attrib(self.path[i][0])
+        return self.path[i][1]
+
+    def close(self):
+        return ElementTable(self.uids, self.indices, self.boxes, self.flags, self.texts, states=self.states)
+
+
+# attributes that change without the screen changing, e.g. clocks and counters, and are left out of the structure hash.
+# Descriptions short enough to be part of an element id (20 characters, up to 100 bytes escaped) are kept
+VOLATILE_ATTRIB_PATTERN = re.compile(rb' (?:text|focused)="[^"]*"| content-desc="[^"]{100,}"')
+
+
+CONTENT_ATTRIB_PATTERN = re.compile(rb' (?:text|focused)="[^"]*"')
+
+
+def get_structure_hash(data):
+    return hashlib.blake2b(VOLATILE_ATTRIB_PATTERN.sub(b"", data), digest_size=16).hexdigest()
+
+
+def get_content_hash(data):
+    # the text and focus of every node that the structure hash leaves out, e.g. what was typed into a field
+    return hashlib.blake2b(b"".join(CONTENT_ATTRIB_PATTERN.findall(data)), digest_size=16).hexdigest()
+
+
+def parse_with_etree(data, builder):
+    for event, elem in iter_xml_events(data):
+        if event == 'start':
+            builder.start(elem.tag, elem.attrib)
+        else:
+            builder.end(elem.tag)
+    return builder.close()
+
+
+expat_intern = {}
+
+
+def parse_with_expat(data, builder):
+    # the expat callbacks go straight to the builder without creating elements, the tag and attribute names are
+    # interned in a dict shared by all parses
+    parser = expat.ParserCreate(intern=expat_intern)
+    parser.StartElementHandler = builder.start
+    parser.EndElementHandler = builder.end
+    parser.Parse(data, True)
+    return builder.close()
+
+
+def parse_with_lxml(data, builder):
+    return lxml_etree.fromstring(data, lxml_etree.XMLParser(target=builder))
+
+
+XML_PARSERS = {"etree": parse_with_etree, "expat": parse_with_expat, "lxml": parse_with_lxml}
+
+
+def get_xml_parser(name=None):
+    name = name or configs["XML_PARSER"]
+    if name == "lxml" and lxml_etree is None:
+        name = "expat"
+    return XML_PARSERS[name]
+
+
+def parse_ui_hierarchy(xml, parser=None):
+    # walks the tree once with the XML_PARSER backend, xml can be a file path, a file-like object or raw bytes. The
+    # structure of the whole tree is hashed from the raw document so it costs no per-node work
+    if isinstance(xml, (bytes, bytearray)):
+        data = bytes(xml)
+    elif hasattr(xml, "read"):
+        data = xml.read()
+    else:
+        with open(xml, "rb") as f:
+            data = f.read()
+    table = get_xml_parser(parser)(data, HierarchyBuilder())
+    table.structure_hash = get_structure_hash(data)
+    table.content_hash = get_content_hash(data)
+    return table
+
+
+def traverse_tree(xml_path, elem_list, attrib, add_index=False):
+    parse_ui_hierarchy(xml_path).get_elements(attrib, add_index, elem_list)
+
+
+def decode_raw_screencap(data):
+    # screencap without -p writes a little-endian header of width, height and pixel format (newer Android versions
+    # append a color space field) followed by the raw pixels, only the 4-byte RGBA/RGBX formats are supported
+    if len(data) < 12:
+        print_with_color("ERROR: Raw screenshot is too short to contain a header", "red")
+        return None
+    width, height, pixel_format = struct.unpack_from("<3I", data)
+    if pixel_format not in (1, 2):
+        print_with_color(f"ERROR: Unsupported raw screenshot pixel format {pixel_format}", "red")
+        return None
+    payload_size = width * height * 4
+    header_size = len(data) - payload_size
+    if header_size not in (12, 16):
+        print_with_color(f"ERROR: Unexpected raw screenshot size {len(data)} for a {width}x{height} screen", "red")
+        return None
+    return np.frombuffer(data, dtype=np.uint8, count=payload_size, offset=header_size).reshape(height, width, 4)
+
+
+def downscale_frame(data, raw=False):
+    # a small grayscale version of the screen is enough to tell whether it is still changing
+    if raw:
+        frame = decode_raw_screencap(data)
+        if frame is None:
+            return None
+        return cv2.cvtColor(np.ascontiguousarray(frame[::8, ::8]), cv2.COLOR_RGBA2GRAY)
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+
+
+def screens_match(sample, last_sample):
+    if isinstance(sample, bytes):
+        return sample == last_sample
+    if sample.shape != last_sample.shape:
+        return False
+    changed = np.count_nonzero(cv2.absdiff(sample, last_sample) > 16)
+    return changed <= configs["SETTLE_THRESHOLD"] * sample.size
+
+
+class Observation:
+    def __init__(self, screenshot, xml_path, screenshot_time, xml_time, total_time, table=None):
+        # screenshot is a MemoryImage or None if the capture failed, screenshot_path is where it is being saved. table
+        # is the ElementTable parsed from the captured hierarchy, None if the capture failed
+        self.screenshot = screenshot
+        self.screenshot_path = "ERROR" if screenshot is None else screenshot.path
+        self.xml_path = xml_path
+        self.table = table
+        self.screenshot_time = screenshot_time
+        self.xml_time = xml_time
+        self.total_time = total_time
+
+
+async def _timed(coro):
+    start = time.time()
+    result = await coro
+    return result, time.time() - start
+
+
+class AdbShellSession:
+    def __init__(self, device, timeout=None):
+        self.device = device
+        self.timeout = configs["ADB_SHELL_TIMEOUT"] if timeout is None else timeout
+        self.proc = None
+        self.lock = asyncio.Lock()
+
+    async def start(self):
+        self.proc = await asyncio.create_subprocess_exec("adb", "-s", self.device, "shell",
+                                                         stdin=asyncio.subprocess.PIPE,
+                                                         stdout=asyncio.subprocess.PIPE,
+                                                         stderr=asyncio.subprocess.PIPE, limit=1 << 24)
+
+    async def close(self):
+        if self.proc is None:
+            return
+        proc, self.proc = self.proc, None
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            await asyncio.wait_for(proc.wait(), timeout=2)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+
+    async def kill(self):
+        # a command that does not return leaves the shell busy, so the session is dropped and restarted on next use
+        if self.proc is None:
+            return
+        proc, self.proc = self.proc, None
+        if proc.returncode is None:
+            proc.kill()
+        try:
+            await asyncio.wait_for(proc.wait(), timeout=2)
+        except asyncio.TimeoutError:
+            pass
+
+    async def is_supported(self):
+        # without the shell_v2 feature (Android < 7) adb shell runs in a pty and merges stderr into stdout, so the
+        # sentinel written to stderr would never arrive there and every command would run into the timeout
+        features = await execute_adb_async(f"adb -s {self.device} features")
+        return features != "ERROR" and "shell_v2" in features.replace(",", "\n").split()
+
+    @staticmethod
+    async def _read_until(stream, sentinel):
+        lines = []
+        while True:
+            line = await stream.readline()
+            if not line:
+                return None, lines
+            line = line.decode("utf-8", errors="replace")
+            if line.startswith(sentinel):
+                return line, lines
+            lines.append(line)
+
+    async def run(self, command):
+        async with self.lock:
+            for attempt in range(2):
+                if self.proc is None or self.proc.returncode is not None:
+                    await self.close()
+                    try:
+                        await self.start()
+                    except OSError as e:
+                        return None, "", str(e)
+                sentinel = f"__appagent_{uuid.uuid4().hex}__"
+                # stdin of the whole command, including every part of a compound one, is redirected so that it cannot
+                # swallow the lines that follow it, and the extra echo guarantees the sentinel starts on its own line
+                # even if the command output has no trailing newline
+                try:
+                    self.proc.stdin.write(f"{{ {command}\n}} </dev/null; __rc=$?; echo; echo {sentinel} $__rc; "
+                                          f"echo {sentinel} >&2\n".encode("utf-8"))
+                    await self.proc.stdin.drain()
+                except OSError:
+                    # the session died since the last command, the command was not delivered so it is safe to retry
+                    await self.close()
+                    continue
+                try:
+                    (status, output), (_, errors) = await asyncio.wait_for(
+                        asyncio.gather(self._read_until(self.proc.stdout, sentinel),
+                                       self._read_until(self.proc.stderr, sentinel)), self.timeout)
+                except asyncio.TimeoutError:
+                    await self.kill()
+                    return None, "", f"adb shell command timed out after {self.timeout}s, the session was restarted"
+                if status is None:
+                    await self.close()
+                    return None, "".join(output), "adb shell session terminated unexpectedly"
+                return int(status.split()[1]), "".join(output), "".join(errors)
+            return None, "", "adb shell session could not be re-established"
+
+    async def execute(self, command):
+        returncode, stdout, stderr = await self.run(command)
+        if returncode == 0:
+            return stdout.strip()
+        print_with_color(f"Command execution failed: adb -s {self.device} shell {command}", "red")
+        print_with_color(stderr, "red")
+        return "ERROR"
+
+
+class AsyncAndroidController:
+    def __init__(self, device):
+        self.device = device
+        self.screenshot_dir = configs["ANDROID_SCREENSHOT_DIR"]
+        self.xml_dir = configs["ANDROID_XML_DIR"]
+        self.screenshot_mode = configs["SCREENSHOT_MODE"]
+        self.xml_mode = configs["XML_MODE"]
+        self.settle_mode = configs["SETTLE_MODE"]
+        self.adb = None
+        self.session = None
+        if configs["ADB_BACKEND"] == "socket":
+            self.adb = AdbClient(configs["ADB_SERVER_HOST"], configs["ADB_SERVER_PORT"])
+        elif configs["ADB_SHELL_SESSION"]:
+            self.session = AdbShellSession(device)
+        self.width, self.height = 0, 0
+        self.backslash = "\\"
+
+    @classmethod
+    async def create(cls, device):
+        controller = cls(device)
+        if controller.session is not None and not await controller.session.is_supported():
+            print_with_color(f"{device} does not support the shell_v2 protocol, its shell commands are run without "
+                             f"the persistent adb shell session", "yellow")
+            controller.session = None
+        controller.width, controller.height = await controller.get_device_size()
+        return controller
+
+    async def execute_socket(self, adb_command, func, *args):
+        try:
+            return await func(self.device, *args)
+        except (AdbError, OSError) as e:
+            print_with_color(f"Command execution failed: {adb_command}", "red")
+            print_with_color(str(e), "red")
+            return "ERROR"
+
+    async def execute_shell(self, command):
+        adb_command = f"adb -s {self.device} shell {command}"
+        if self.adb is not None:
+            result = await self.execute_socket(adb_command, self.adb.shell, command)
+            if result == "ERROR":
+                return result
+            returncode, stdout, stderr = result
+            if returncode == 0:
+                return stdout.decode("utf-8", errors="replace").strip()
+            print_with_color(f"Command execution failed: {adb_command}", "red")
+            print_with_color((stderr or stdout).decode("utf-8", errors="replace"), "red")
+            return "ERROR"
+        if self.session is not None:
+            return await self.session.execute(command)
+        return await execute_adb_async(adb_command)
+
+    async def execute_exec_out(self, command):
+        adb_command = f"adb -s {self.device} exec-out {command}"
+        if self.adb is not None:
+            return await self.execute_socket(adb_command, self.adb.exec_out, command)
+        return await execute_adb_async(adb_command, binary=True)
+
+    async def pull(self, remote_path, local_path):
+        adb_command = f"adb -s {self.device} pull {remote_path} {local_path}"
+        if self.adb is not None:
+            return await self.execute_socket(adb_command, self.adb.pull, remote_path, local_path)
+        return await execute_adb_async(adb_command)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+        if self.adb is not None:
+            self.adb.close()
+
+    async def get_device_size(self):
+        result = await self.execute_shell("wm size")
+        if result != "ERROR":
+            return tuple(map(int, result.split(": ")[1].split("x")))
+        return 0, 0
+
+    async def get_screenshot_bytes(self):
+        data = await self.execute_exec_out("screencap" if self.screenshot_mode == "raw" else "screencap -p")
+        if not data:
+            print_with_color("ERROR: The device returned an empty screenshot", "red")
+            return "ERROR"
+        return data
+
+    async def get_screenshot_frame(self):
+        data = await self.get_screenshot_bytes()
+        if data == "ERROR":
+            return None
+        if self.screenshot_mode == "raw":
+            return decode_raw_screencap(data)
+        frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            print_with_color("ERROR: Failed to decode the screenshot received from the device", "red")
+        return frame
+
+    async def get_screenshot_image(self, prefix=None, save_dir=None):
+        # the screenshot stays in memory as a MemoryImage, it is also saved to save_dir in the background if one is
+        # given. Only the pull mode goes through a file, which is then read lazily
+        if self.screenshot_mode == "pull":
+            remote_path = os.path.join(self.screenshot_dir, prefix + ".png").replace(self.backslash, "/")
+            local_path = os.path.join(save_dir or tempfile.gettempdir(), prefix + ".png")
+            result = await self.execute_shell(f"screencap -p {remote_path}")
+            if result != "ERROR":
+                result = await self.pull(remote_path, local_path)
+            if result == "ERROR":
+                return None
+            return MemoryImage.from_file(local_path)
+        if self.screenshot_mode == "raw":
+            frame = await self.get_screenshot_frame()
+            if frame is None:
+                return None
+            image = MemoryImage(cv2.cvtColor(frame, cv2.COLOR_RGBA2BGR))
+        else:
+            data = await self.get_screenshot_bytes()
+            if data == "ERROR":
+                return None
+            image = MemoryImage(data=data)
+        if save_dir:
+            image.save(os.path.join(save_dir, prefix + ".png"))
+        return image
+
+    async def get_screenshot(self, prefix, save_dir):
+        image = await self.get_screenshot_image(prefix, save_dir)
+        if image is None:
+            return "ERROR"
+        await asyncio.wrap_future(image.saved)
+        return image.path
+
+    async def get_xml_bytes(self, prefix=None, save_dir=None):
+        data = await self.execute_exec_out("uiautomator dump /dev/tty")
+        if data == "ERROR":
+            return None
+        xml = strip_uiautomator_trailer(data)
+        if xml is None:
+            print_with_color("ERROR: No UI hierarchy found in the uiautomator output", "red")
+            print_with_color(data.decode("utf-8", errors="replace"), "red")
+            return None
+        if save_dir:
+            save_file_async(os.path.join(save_dir, prefix + ".xml"), xml)
+        return xml
+
+    async def get_xml(self, prefix, save_dir):
+        if self.xml_mode == "exec-out":
+            xml = await self.get_xml_bytes()
+            if xml is None:
+                return "ERROR"
+            xml_path = os.path.join(save_dir, prefix + ".xml")
+            await asyncio.wrap_future(save_file_async(xml_path, xml))
+            return xml_path
+        dump_command = "uiautomator dump " \
+                       f"{os.path.join(self.xml_dir, prefix + '.xml').replace(self.backslash, '/')}"
+        result = await self.execute_shell(dump_command)
+        if result != "ERROR":
+            result = await self.pull(os.path.join(self.xml_dir, prefix + '.xml').replace(self.backslash, '/'),
+                                     os.path.join(save_dir, prefix + '.xml'))
+            if result != "ERROR":
+                return os.path.join(save_dir, prefix + ".xml")
+            return result
+        return result
+
+    async def get_ui_hierarchy(self, prefix, save_dir):
+        # in exec-out mode the hierarchy is parsed from the dumped bytes while its file is written in the background,
+        # the parsing runs off the event loop in both modes. Returns the path of the XML file and the ElementTable
+        if self.xml_mode == "exec-out":
+            xml = await self.get_xml_bytes(prefix, save_dir)
+            if xml is None:
+                return "ERROR", None
+            xml_path = os.path.join(save_dir, prefix + ".xml")
+        else:
+            xml = xml_path = await self.get_xml(prefix, save_dir)
+            if xml_path == "ERROR":
+                return "ERROR", None
+        return xml_path, await asyncio.to_thread(parse_ui_hierarchy, xml)
+
+    async def get_settle_sample(self):
+        if self.settle_mode == "xml":
+            return await self.get_xml_bytes()
+        data = await self.get_screenshot_bytes()
+        if data == "ERROR":
+            return None
+        return downscale_frame(data, self.screenshot_mode == "raw")
+
+    async def wait_for_settle(self):
+        # polls cheap samples of the screen after an action until they stay the same for SETTLE_WINDOW seconds,
+        # instead of sleeping a fixed time that is far longer than most transitions take
+        start = time.time()
+        last_sample, stable_since = None, start
+        while True:
+            sample = await self.get_settle_sample()
+            now = time.time()
+            if sample is None:
+                return now - start
+            if last_sample is None or not screens_match(sample, last_sample):
+                stable_since = now
+            elif now - stable_since >= configs["SETTLE_WINDOW"]:
+                return now - start
+            if now - start >= configs["SETTLE_TIMEOUT"]:
+                print_with_color(f"The screen did not settle within {configs['SETTLE_TIMEOUT']}s", "yellow")
+                return now - start
+            last_sample = sample
+            await asyncio.sleep(configs["SETTLE_INTERVAL"])
+
+    async def capture_observation(self, prefix, save_dir, xml_prefix=None, xml_dir=None, save_screenshot=True):
+        # the screenshot and the UI hierarchy are independent device operations, so they are captured concurrently
+        start = time.time()
+        (screenshot, screenshot_time), ((xml_path, table), xml_time) = await asyncio.gather(
+            _timed(self.get_screenshot_image(prefix, save_dir if save_screenshot else None)),
+            _timed(self.get_ui_hierarchy(xml_prefix or prefix, xml_dir or save_dir)))
+        return Observation(screenshot, xml_path, screenshot_time, xml_time, time.time() - start, table)
+
+    async def back(self):
+        adb_command = "input keyevent KEYCODE_BACK"
+        ret = await self.execute_shell(adb_command)
+        return ret
+
+    async def tap(self, x, y):
+        adb_command = f"input tap {x} {y}"
+        ret = await self.execute_shell(adb_command)
+        return ret
+
+    async def text(self, input_str):
+        input_str = input_str.replace(" ", "%s")
+        input_str = input_str.replace("'", "")
+        adb_command = f"input text {input_str}"
+        ret = await self.execute_shell(adb_command)
+        return ret
+
+    async def enter(self):
+        adb_command = "input keyevent KEYCODE_ENTER"
+        ret = await self.execute_shell(adb_command)
+        return ret
+
+    async def long_press(self, x, y, duration=1000):
+        adb_command = f"input swipe {x} {y} {x} {y} {duration}"
+        ret = await self.execute_shell(adb_command)
+        return ret
+
+    async def swipe(self, x, y, direction, dist="medium", quick=False):
+        unit_dist = int(self.width / 10)
+        if dist == "long":
+            unit_dist *= 3
+        elif dist == "medium":
+            unit_dist *= 2
+        if direction == "up":
+            offset = 0, -2 * unit_dist
+        elif direction == "down":
+            offset = 0, 2 * unit_dist
+        elif direction == "left":
+            offset = -1 * unit_dist, 0
+        elif direction == "right":
+            offset = unit_dist, 0
+        else:
+            return "ERROR"
+        duration = 100 if quick else 400
+        adb_command = f"input swipe {x} {y} {x+offset[0]} {y+offset[1]} {duration}"
+        ret = await self.execute_shell(adb_command)
+        return ret
+
+    async def swipe_precise(self, start, end, duration=400):
+        start_x, start_y = start
+        end_x, end_y = end
+        adb_command = f"input swipe {start_x} {start_x} {end_x} {end_y} {duration}"
+        ret = await self.execute_shell(adb_command)
+        return ret
+
+
+class AndroidController:
+    # synchronous facade over AsyncAndroidController, every call runs on the shared background event loop
+    def __init__(self, device):
+        self.aio = run_sync(AsyncAndroidController.create(device))
+        self.device = device
+        self.width, self.height = self.aio.width, self.aio.height
+
+    def execute_shell(self, command):
+        return run_sync(self.aio.execute_shell(command))
+
+    def execute_exec_out(self, command):
+        return run_sync(self.aio.execute_exec_out(command))
+
+    def pull(self, remote_path, local_path):
+        return run_sync(self.aio.pull(remote_path, local_path))
+
+    def close(self):
+        return run_sync(self.aio.close())
+
+    def get_device_size(self):
+        return run_sync(self.aio.get_device_size())
+
+    def get_screenshot_bytes(self):
+        return run_sync(self.aio.get_screenshot_bytes())
+
+    def get_screenshot_frame(self):
+        return run_sync(self.aio.get_screenshot_frame())
+
+    def get_screenshot_image(self, prefix=None, save_dir=None):
+        return run_sync(self.aio.get_screenshot_image(prefix, save_dir))
+
+    def get_screenshot(self, prefix, save_dir):
+        return run_sync(self.aio.get_screenshot(prefix, save_dir))
+
+    def get_xml_bytes(self, prefix=None, save_dir=None):
+        return run_sync(self.aio.get_xml_bytes(prefix, save_dir))
+
+    def get_xml(self, prefix, save_dir):
+        return run_sync(self.aio.get_xml(prefix, save_dir))
+
+    def get_ui_hierarchy(self, prefix, save_dir):
+        return run_sync(self.aio.get_ui_hierarchy(prefix, save_dir))
+
+    def capture_observation(self, prefix, save_dir, xml_prefix=None, xml_dir=None, save_screenshot=True):
+        return run_sync(self.aio.capture_observation(prefix, save_dir, xml_prefix, xml_dir, save_screenshot))
+
+    def wait_for_settle(self):
+        return run_sync(self.aio.wait_for_settle())
+
+    def back(self):
+        return run_sync(self.aio.back())
+
+    def tap(self, x, y):
+        return run_sync(self.aio.tap(x, y))
+
+    def text(self, input_str):
+        return run_sync(self.aio.text(input_str))
+
+    def enter(self):
+        return run_sync(self.aio.enter())
+
+    def long_press(self, x, y, duration=1000):
+        return run_sync(self.aio.long_press(x, y, duration))
+
+    def swipe(self, x, y, direction, dist="medium", quick=False):
+        return run_sync(self.aio.swipe(x, y, direction, dist, quick))
+
+    def swipe_precise(self, start, end, duration=400):
+        return run_sync(self.aio.swipe_precise(start, end, duration))
@@ -0,0 +1,105 @@
+import argparse
+import io
+import random
+import time
+import xml.etree.ElementTree as ET
+
+from and_controller import XML_PARSERS, get_id_from_element, lxml_etree, parse_ui_hierarchy
+
+
+def generate_hierarchy(node_count, seed=0):
+    # a synthetic uiautomator dump with node_count nodes nested up to 6 levels deep
+    rng = random.Random(seed)
+    attrib = 'checkable="false" checked="false" enabled="true" focused="false" password="false" selected="false"'
+    nodes = ['<?xml version=\'1.0\' encoding=\'UTF-8\' standalone=\'yes\' ?><hierarchy rotation="0">'
+             f'<node index="0" text="" resource-id="" class="android.widget.FrameLayout" package="com.app" '
+             f'content-desc="" {attrib} clickable="false" focusable="false" scrollable="false" long-clickable="false" '
+             f'bounds="[0,0][1080,2400]">']
+    count = 0
+
+    def add_node(depth):
+        nonlocal count
+        count += 1
+        x1, y1 = rng.randint(0, 1000), rng.randint(0, 2300)
+        x2, y2 = x1 + rng.randint(10, 80), y1 + rng.randint(10, 100)
+        flags = " ".join(f'{name}="{"true" if rng.random() < share else "false"}"'
+                         for name, share in (("clickable", 0.2), ("focusable", 0.1), ("scrollable", 0.03),
+                                             ("long-clickable", 0.05)))
+        nodes.append(f'<node index="{count % 7}" text="item {count}" '
+                     f'resource-id="{rng.choice(["", f"com.app:id/item{count % 50}"])}" '
+                     f'class="{rng.choice(["android.widget.TextView", "android.widget.ImageView"])}" '
+                     f'package="com.app" content-desc="{rng.choice(["", "Search", "Open the navigation drawer"])}" '
+                     f'{attrib} {flags} bounds="[{x1},{y1}][{x2},{y2}]"')
+        if depth < 6 and count < node_count:
+            nodes.append(">")
+            for _ in range(rng.randint(1, 4)):
+                if count < node_count:
+                    add_node(depth + 1)
+            nodes.append("</node>")
+        else:
+            nodes.append(" />")
+
+    while count < node_count:
+        add_node(1)
+    nodes.append("</node></hierarchy>")
+    return "".join(nodes).encode("utf-8")
+
+
+def legacy_traverse_tree(xml, elem_list, attrib):
+    # the original ElementTree traversal, which every round ran once for the clickable and once for the focusable
+    # elements, kept here as the baseline without its MIN_DIST filtering
+    path = []
+    for event, elem in ET.iterparse(io.BytesIO(xml), ['start', 'end']):
+        if event == 'start':
+            path.append(elem)
+            if attrib in elem.attrib and elem.attrib[attrib] == "true":
+                parent_prefix = ""
+                if len(path) > 1:
+                    parent_prefix = get_id_from_element(path[-2])
+                bounds = elem.attrib["bounds"][1:-1].split("][")
+                x1, y1 = map(int, bounds[0].split(","))
+                x2, y2 = map(int, bounds[1].split(","))
+                elem_id = get_id_from_element(elem)
+                if parent_prefix:
+                    elem_id = parent_prefix + "_" + elem_id
+                elem_list.append((elem_id, ((x1, y1), (x2, y2))))
+        if event == 'end':
+            path.pop()
+
+
+def legacy_parse(xml):
+    legacy_traverse_tree(xml, [], "clickable")
+    legacy_traverse_tree(xml, [], "focusable")
+
+
+def time_call(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the UI hierarchy parser backends")
+    parser.add_argument("--nodes", default="500,2000,10000", help="Comma-separated node counts of the synthetic dumps")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = vars(parser.parse_args())
+
+    backends = [name for name in XML_PARSERS if name != "lxml" or lxml_etree is not None]
+    print("Median time to extract the interactive elements, and the speedup over the legacy traverse_tree passes")
+    print(f"{'nodes':>8} {'size':>10} {'legacy':>10} " + " ".join(f"{name:>16}" for name in backends))
+    for node_count in map(int, args["nodes"].split(",")):
+        xml = generate_hierarchy(node_count)
+        reference = parse_ui_hierarchy(xml, "etree")
+        for name in backends:
+            table = parse_ui_hierarchy(xml, name)
+            assert table.uids == reference.uids and table.flags.tolist() == reference.flags.tolist(), name
+        baseline = time_call(lambda: legacy_parse(xml), args["repeat"])
+        results = []
+        for name in backends:
+            elapsed = time_call(lambda: parse_ui_hierarchy(xml, name), args["repeat"])
+            results.append(f"{elapsed * 1000:8.2f}ms {baseline / elapsed:4.1f}x")
+        print(f"{node_count:>8} {len(xml) // 1024:>8}KB {baseline * 1000:>8.2f}ms " +
+              " ".join(f"{result:>16}" for result in results))
@@ -0,0 +1,76 @@
+import asyncio
+import os
+import tempfile
+import time
+
+from adb_client import AdbClient, AdbError
+from fake_adb_server import FakeAdbServer, FakeDevice
+
+PULL_DELAY = 0.5
+
+
+class SlowDevice(FakeDevice):
+    # serves every pulled file after PULL_DELAY seconds, so pulls that wait on each other show up in the elapsed time
+    def read_file(self, path):
+        time.sleep(PULL_DELAY)
+        return super().read_file(path)
+
+
+def handle_command(command):
+    if command == "fail":
+        return 3, b"", b"failed\n"
+    return 0, command.encode("utf-8") + b"\n", b""
+
+
+async def run_checks(port):
+    client = AdbClient(port=port)
+    try:
+        devices = await client.devices()
+        assert devices == ["phone-1", "phone-2", "legacy-1"], f"unexpected device list {devices}"
+
+        assert await client.shell("phone-1", "echo hi") == (0, b"echo hi\n", b""), "shell v2 output differs"
+        assert await client.shell("phone-1", "fail") == (3, b"", b"failed\n"), "shell v2 exit code or stderr lost"
+        # the legacy device runs the commands on the local shell, which has to run the echo of the exit code
+        assert (await client.shell("legacy-1", "echo hi; false"))[:2] == (1, b"hi"), "legacy shell output differs"
+        assert await client.exec_out("phone-2", "cat") == b"cat\n", "exec output differs"
+
+        assert await client.pull_bytes("phone-1", "/sdcard/a.xml") == b"<a/>", "pulled data differs"
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            local_path = os.path.join(tmp_dir, "b.xml")
+            assert await client.pull("phone-2", "/sdcard/b.xml", local_path) == 4, "pulled size differs"
+            with open(local_path, "rb") as f:
+                assert f.read() == b"<b/>", "pulled file differs"
+        try:
+            await client.pull_bytes("phone-1", "/sdcard/missing.xml")
+            raise AssertionError("pulling a missing file did not fail")
+        except AdbError:
+            pass
+        assert await client.pull_bytes("phone-1", "/sdcard/a.xml") == b"<a/>", "pull after a failed pull differs"
+
+        # pulls from two devices use separate sync connections and must not wait for each other
+        start = time.time()
+        results = await asyncio.gather(client.pull_bytes("phone-1", "/sdcard/a.xml"),
+                                       client.pull_bytes("phone-2", "/sdcard/b.xml"))
+        elapsed = time.time() - start
+        assert results == [b"<a/>", b"<b/>"], "concurrent pulls returned the wrong data"
+        assert elapsed < 1.5 * PULL_DELAY, f"pulls from two devices were serialized ({elapsed:.2f}s)"
+        return elapsed
+    finally:
+        client.close()
+
+
+def check_adb_client():
+    devices = [SlowDevice("phone-1", handle_command, {"/sdcard/a.xml": b"<a/>"}),
+               SlowDevice("phone-2", handle_command, {"/sdcard/b.xml": b"<b/>"}),
+               FakeDevice("legacy-1", shell_v2=False)]
+    server = FakeAdbServer(devices).start()
+    try:
+        elapsed = asyncio.run(run_checks(server.port))
+    finally:
+        server.stop()
+    print(f"devices, shell, exec and pull work against the fake adb server, concurrent pulls from two devices took "
+          f"{elapsed:.2f}s with a {PULL_DELAY}s delay per pull")
+
+
+if __name__ == "__main__":
+    check_adb_client()
@@ -0,0 +1,36 @@
+import os
+import tempfile
+
+import cv2
+import numpy as np
+
+from and_controller import parse_ui_hierarchy
+from benchmark_xml import generate_hierarchy
+from utils import MemoryImage, draw_bbox_multi, draw_grid
+
+
+def check_labeling():
+    # the screenshot forms the capture modes hand to the labeling must all give the same labeled image: a BGR frame
+    # from exec-out, a read-only RGBA frame from raw, a MemoryImage and a PNG file from pull
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (2400, 1080, 3), dtype=np.uint8)
+    rgba = cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA)
+    rgba.flags.writeable = False
+    elem_list = parse_ui_hierarchy(generate_hierarchy(300)).get_elem_list()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "screenshot.png")
+        cv2.imwrite(path, frame)
+        inputs = {"bgr frame": frame, "rgba frame": rgba, "memory image": MemoryImage(frame.copy()), "file": path}
+        reference_labels = draw_bbox_multi(frame.copy(), None, elem_list).get_frame()
+        reference_grid = draw_grid(frame.copy(), None)[0].get_frame()
+        for name, img in inputs.items():
+            labeled = draw_bbox_multi(img, None, elem_list).get_frame()
+            assert np.array_equal(labeled, reference_labels), f"labeling the {name} differs"
+            grid, rows, cols = draw_grid(img, None)
+            assert rows and cols and np.array_equal(grid.get_frame(), reference_grid), f"the grid of the {name} differs"
+        assert np.array_equal(frame, cv2.cvtColor(rgba, cv2.COLOR_RGBA2BGR)), "the input frame was drawn on"
+    print(f"Labeled {len(elem_list)} elements and the grid on {', '.join(inputs)}")
+
+
+if __name__ == "__main__":
+    check_labeling()
@@ -1,10 +1,10 @@
-import os
-import yaml
-
-
-def load_config(config_path="../config.yaml"):
-    configs = dict(os.environ)
-    with open(config_path, "r") as file:
-        yaml_data = yaml.safe_load(file)
-    configs.update(yaml_data)
-    return configs
+import os
+import yaml
+
+
+def load_config(config_path="../config.yaml"):
+    configs = dict(os.environ)
+    with open(config_path, "r") as file:
+        yaml_data = yaml.safe_load(file)
+    configs.update(yaml_data)
+    return configs
@@ -1,134 +1,203 @@
-import argparse
-import ast
-import json
-import os
-import re
-import sys
-import time
-
-import prompts
-from config import load_config
-from model import OpenAIModel, QwenModel
-from utils import print_with_color
-
-arg_desc = "AppAgent - Human Demonstration"
-parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, description=arg_desc)
-parser.add_argument("--app", required=True)
-parser.add_argument("--demo", required=True)
-parser.add_argument("--root_dir", default="./")
-args = vars(parser.parse_args())
-
-configs = load_config()
-
-if configs["MODEL"] == "OpenAI":
-    mllm = OpenAIModel(base_url=configs["OPENAI_API_BASE"],
-                       api_key=configs["OPENAI_API_KEY"],
-                       model=configs["OPENAI_API_MODEL"],
-                       temperature=configs["TEMPERATURE"],
-                       max_tokens=configs["MAX_TOKENS"])
-elif configs["MODEL"] == "Qwen":
-    mllm = QwenModel(api_key=configs["DASHSCOPE_API_KEY"],
-                     model=configs["QWEN_MODEL"])
-else:
-    print_with_color(f"ERROR: Unsupported model type {configs['MODEL']}!", "red")
-    sys.exit()
-
-root_dir = args["root_dir"]
-work_dir = os.path.join(root_dir, "apps")
-if not os.path.exists(work_dir):
-    os.mkdir(work_dir)
-app = args["app"]
-work_dir = os.path.join(work_dir, app)
-demo_dir = os.path.join(work_dir, "demos")
-demo_name = args["demo"]
-task_dir = os.path.join(demo_dir, demo_name)
-xml_dir = os.path.join(task_dir, "xml")
-labeled_ss_dir = os.path.join(task_dir, "labeled_screenshots")
-record_path = os.path.join(task_dir, "record.txt")
-task_desc_path = os.path.join(task_dir, "task_desc.txt")
-if not os.path.exists(task_dir) or not os.path.exists(xml_dir) or not os.path.exists(labeled_ss_dir) \
-        or not os.path.exists(record_path) or not os.path.exists(task_desc_path):
-    sys.exit()
-log_path = os.path.join(task_dir, f"log_{app}_{demo_name}.txt")
-
-docs_dir = os.path.join(work_dir, "demo_docs")
-if not os.path.exists(docs_dir):
-    os.mkdir(docs_dir)
-
-print_with_color(f"Starting to generate documentations for the app {app} based on the demo {demo_name}", "yellow")
-doc_count = 0
-with open(record_path, "r") as infile:
-    step = len(infile.readlines()) - 1
-    infile.seek(0)
-    for i in range(1, step + 1):
-        img_before = os.path.join(labeled_ss_dir, f"{demo_name}_{i}.png")
-        img_after = os.path.join(labeled_ss_dir, f"{demo_name}_{i + 1}.png")
-        rec = infile.readline().strip()
-        action, resource_id = rec.split(":::")
-        action_type = action.split("(")[0]
-        action_param = re.findall(r"\((.*?)\)", action)[0]
-        if action_type == "tap":
-            prompt_template = prompts.tap_doc_template
-            prompt = re.sub(r"<ui_element>", action_param, prompt_template)
-        elif action_type == "text":
-            input_area, input_text = action_param.split(":sep:")
-            prompt_template = prompts.text_doc_template
-            prompt = re.sub(r"<ui_element>", input_area, prompt_template)
-        elif action_type == "long_press":
-            prompt_template = prompts.long_press_doc_template
-            prompt = re.sub(r"<ui_element>", action_param, prompt_template)
-        elif action_type == "swipe":
-            swipe_area, swipe_dir = action_param.split(":sep:")
-            if swipe_dir == "up" or swipe_dir == "down":
-                action_type = "v_swipe"
-            elif swipe_dir == "left" or swipe_dir == "right":
-                action_type = "h_swipe"
-            prompt_template = prompts.swipe_doc_template
-            prompt = re.sub(r"<swipe_dir>", swipe_dir, prompt_template)
-            prompt = re.sub(r"<ui_element>", swipe_area, prompt)
-        else:
-            break
-        task_desc = open(task_desc_path, "r").read()
-        prompt = re.sub(r"<task_desc>", task_desc, prompt)
-
-        doc_name = resource_id + ".txt"
-        doc_path = os.path.join(docs_dir, doc_name)
-
-        if os.path.exists(doc_path):
-            doc_content = ast.literal_eval(open(doc_path).read())
-            if doc_content[action_type]:
-                if configs["DOC_REFINE"]:
-                    suffix = re.sub(r"<old_doc>", doc_content[action_type], prompts.refine_doc_suffix)
-                    prompt += suffix
-                    print_with_color(f"Documentation for the element {resource_id} already exists. The doc will be "
-                                     f"refined based on the latest demo.", "yellow")
-                else:
-                    print_with_color(f"Documentation for the element {resource_id} already exists. Turn on DOC_REFINE "
-                                     f"in the config file if needed.", "yellow")
-                    continue
-        else:
-            doc_content = {
-                "tap": "",
-                "text": "",
-                "v_swipe": "",
-                "h_swipe": "",
-                "long_press": ""
-            }
-
-        print_with_color(f"Waiting for GPT-4V to generate documentation for the element {resource_id}", "yellow")
-        status, rsp = mllm.get_model_response(prompt, [img_before, img_after])
-        if status:
-            doc_content[action_type] = rsp
-            with open(log_path, "a") as logfile:
-                log_item = {"step": i, "prompt": prompt, "image_before": f"{demo_name}_{i}.png",
-                            "image_after": f"{demo_name}_{i + 1}.png", "response": rsp}
-                logfile.write(json.dumps(log_item) + "\n")
-            with open(doc_path, "w") as outfile:
-                outfile.write(str(doc_content))
-            doc_count += 1
-            print_with_color(f"Documentation generated and saved to {doc_path}", "yellow")
-        else:
-            print_with_color(rsp, "red")
-        time.sleep(configs["REQUEST_INTERVAL"])
-
-print_with_color(f"Documentation generation phase completed. {doc_count} docs generated.", "yellow")
+import argparse
+import ast
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+
+import prompts
+from config import load_config
+from task_executor import create_model
+from utils import print_with_color
+
+arg_desc = "AppAgent - Human Demonstration"
+parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, description=arg_desc)
+parser.add_argument("--app", required=True)
+parser.add_argument("--demo", required=True)
+parser.add_argument("--root_dir", default="./")
+parser.add_argument("--workers", type=int, help="Max number of documentation requests in flight, defaults to "
+                                                "DOC_WORKERS in the config file")
+args = vars(parser.parse_args())
+
+configs = load_config()
+
+mllm = create_model()
+if mllm is None:
+    sys.exit()
+
+root_dir = args["root_dir"]
+work_dir = os.path.join(root_dir, "apps")
+if not os.path.exists(work_dir):
+    os.mkdir(work_dir)
+app = args["app"]
+work_dir = os.path.join(work_dir, app)
+demo_dir = os.path.join(work_dir, "demos")
+demo_name = args["demo"]
+task_dir = os.path.join(demo_dir, demo_name)
+xml_dir = os.path.join(task_dir, "xml")
+labeled_ss_dir = os.path.join(task_dir, "labeled_screenshots")
+record_path = os.path.join(task_dir, "record.txt")
+task_desc_path = os.path.join(task_dir, "task_desc.txt")
+if not os.path.exists(task_dir) or not os.path.exists(xml_dir) or not os.path.exists(labeled_ss_dir) \
+        or not os.path.exists(record_path) or not os.path.exists(task_desc_path):
+    sys.exit()
+log_path = os.path.join(task_dir, f"log_{app}_{demo_name}.txt")
+
+docs_dir = os.path.join(work_dir, "demo_docs")
+if not os.path.exists(docs_dir):
+    os.mkdir(docs_dir)
+
+workers = max(1, args["workers"] or configs["DOC_WORKERS"])
+
+
+def load_steps():
+    # every demo step as (step, action_type, resource_id, prompt), parsing stops at the first unknown action
+    steps = []
+    task_desc = open(task_desc_path, "r").read()
+    with open(record_path, "r") as infile:
+        step = len(infile.readlines()) - 1
+        infile.seek(0)
+        for i in range(1, step + 1):
+            rec = infile.readline().strip()
+            action, resource_id = rec.split(":::")
+            action_type = action.split("(")[0]
+            action_param = re.findall(r"\((.*?)\)", action)[0]
+            if action_type == "tap":
+                prompt_template = prompts.tap_doc_template
+                prompt = re.sub(r"<ui_element>", action_param, prompt_template)
+            elif action_type == "text":
+                input_area, input_text = action_param.split(":sep:")
+                prompt_template = prompts.text_doc_template
+                prompt = re.sub(r"<ui_element>", input_area, prompt_template)
+            elif action_type == "long_press":
+                prompt_template = prompts.long_press_doc_template
+                prompt = re.sub(r"<ui_element>", action_param, prompt_template)
+            elif action_type == "swipe":
+                swipe_area, swipe_dir = action_param.split(":sep:")
+                if swipe_dir == "up" or swipe_dir == "down":
+                    action_type = "v_swipe"
+                elif swipe_dir == "left" or swipe_dir == "right":
+                    action_type = "h_swipe"
+                prompt_template = prompts.swipe_doc_template
+                prompt = re.sub(r"<swipe_dir>", swipe_dir, prompt_template)
+                prompt = re.sub(r"<ui_element>", swipe_area, prompt)
+            else:
+                break
+            prompt = re.sub(r"<task_desc>", task_desc, prompt)
+            steps.append((i, action_type, resource_id, prompt))
+    return steps
+
+
+def read_doc(doc_path):
+    if os.path.exists(doc_path):
+        return ast.literal_eval(open(doc_path).read())
+    return {
+        "tap": "",
+        "text": "",
+        "v_swipe": "",
+        "h_swipe": "",
+        "long_press": ""
+    }
+
+
+def write_doc(doc_path, action_type, rsp):
+    # re-reads the doc before writing, so the docs of the other actions of the element written meanwhile are kept
+    doc_content = read_doc(doc_path)
+    doc_content[action_type] = rsp
+    with open(doc_path, "w") as outfile:
+        outfile.write(str(doc_content))
+
+
+class Progress:
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.generated = 0
+        self.skipped = 0
+        self.failed = 0
+        self.start = time.time()
+
+    def update(self, outcome):
+        self.done += 1
+        setattr(self, outcome, getattr(self, outcome) + 1)
+        elapsed = time.time() - self.start
+        print_with_color(f"Progress: {self.done}/{self.total} steps ({self.generated} generated, {self.skipped} "
+                         f"skipped, {self.failed} failed), {elapsed:.1f}s elapsed, "
+                         f"{self.done / elapsed * 60 if elapsed else 0:.1f} steps/min", "yellow")
+
+
+async def generate_doc(step, semaphore, doc_locks, log_lock, progress):
+    i, action_type, resource_id, prompt = step
+    doc_path = os.path.join(docs_dir, resource_id + ".txt")
+    async with doc_locks[resource_id]:
+        doc_content = await asyncio.to_thread(read_doc, doc_path)
+    if doc_content[action_type]:
+        if configs["DOC_REFINE"]:
+            suffix = re.sub(r"<old_doc>", doc_content[action_type], prompts.refine_doc_suffix)
+            prompt += suffix
+            print_with_color(f"Documentation for the element {resource_id} already exists. The doc will be "
+                             f"refined based on the latest demo.", "yellow")
+        else:
+            print_with_color(f"Documentation for the element {resource_id} already exists. Turn on DOC_REFINE "
+                             f"in the config file if needed.", "yellow")
+            progress.update("skipped")
+            return False
+
+    img_before = os.path.join(labeled_ss_dir, f"{demo_name}_{i}.png")
+    img_after = os.path.join(labeled_ss_dir, f"{demo_name}_{i + 1}.png")
+    async with semaphore:
+        print_with_color(f"Waiting for GPT-4V to generate documentation for the element {resource_id}", "yellow")
+        status, rsp = await mllm.get_model_response_async(prompt, [img_before, img_after])
+    if not status:
+        print_with_color(rsp, "red")
+        progress.update("failed")
+        return False
+    async with log_lock:
+        with open(log_path, "a") as logfile:
+            log_item = {"step": i, "prompt": prompt, "image_before": f"{demo_name}_{i}.png",
+                        "image_after": f"{demo_name}_{i + 1}.png", "response": rsp}
+            logfile.write(json.dumps(log_item) + "\n")
+    async with doc_locks[resource_id]:
+        await asyncio.to_thread(write_doc, doc_path, action_type, rsp)
+    print_with_color(f"Documentation generated and saved to {doc_path}", "yellow")
+    progress.update("generated")
+    return True
+
+
+async def generate_chain(chain, semaphore, doc_locks, log_lock, progress):
+    # the steps on one element and action depend on each other through the existing doc, so they run in demo order
+    # and the doc ends up the same as in a sequential run
+    doc_count = 0
+    for step in chain:
+        if await generate_doc(step, semaphore, doc_locks, log_lock, progress):
+            doc_count += 1
+    return doc_count
+
+
+async def main():
+    print_with_color(f"Starting to generate documentations for the app {app} based on the demo {demo_name}", "yellow")
+    steps = load_steps()
+    chains = {}
+    for step in steps:
+        chains.setdefault((step[2], step[1]), []).append(step)
+    # model requests are bounded by the workers and paced by the rate limiter of the model, the writes to each
+    # <resource_id>.txt are serialized by a lock per element
+    semaphore = asyncio.Semaphore(workers)
+    doc_locks = {resource_id: asyncio.Lock() for resource_id, _ in chains}
+    log_lock = asyncio.Lock()
+    progress = Progress(len(steps))
+    print_with_color(f"{len(steps)} steps on {len(chains)} element actions, up to {workers} requests in parallel",
+                     "yellow")
+    doc_counts = await asyncio.gather(*[generate_chain(chain, semaphore, doc_locks, log_lock, progress)
+                                        for chain in chains.values()])
+    await mllm.close_async()
+    elapsed = time.time() - progress.start
+    print_with_color(f"Model connections: {mllm.get_stats()}", "yellow")
+    print_with_color(f"Documentation generation phase completed in {elapsed:.1f}s "
+                     f"({progress.done / elapsed * 60 if elapsed else 0:.1f} steps/min). {sum(doc_counts)} docs "
+                     f"generated.", "yellow")
+
+
+asyncio.run(main())
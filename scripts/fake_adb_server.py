@@ -0,0 +1,172 @@
+import argparse
+import socketserver
+import struct
+import subprocess
+import threading
+
+from adb_client import SHELL_STDOUT, SHELL_STDERR, SHELL_EXIT, encode_request
+
+
+class FakeDevice:
+    # a stand-in for a phone behind the adb server, shell and exec commands are answered by the handler and files
+    # pulled through the sync service are served from the files dict, or from the local disk if no dict is given
+    def __init__(self, serial, handler=None, files=None, shell_v2=True):
+        self.serial = serial
+        self.handler = handler or run_locally
+        self.files = files
+        self.shell_v2 = shell_v2
+        self.commands = []
+
+    def run(self, command):
+        self.commands.append(command)
+        return self.handler(command)
+
+    def read_file(self, path):
+        if self.files is not None:
+            return self.files.get(path)
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+
+def run_locally(command):
+    result = subprocess.run(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return result.returncode, result.stdout, result.stderr
+
+
+class FakeAdbHandler(socketserver.BaseRequestHandler):
+    def send_okay(self):
+        self.request.sendall(b"OKAY")
+
+    def send_fail(self, message):
+        self.request.sendall(b"FAIL" + encode_request(message))
+
+    def read_exact(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError
+            data += chunk
+        return data
+
+    def read_request(self):
+        size = int(self.read_exact(4), 16)
+        return self.read_exact(size).decode("utf-8")
+
+    def handle(self):
+        try:
+            self.handle_requests()
+        except ConnectionError:
+            pass
+
+    def handle_requests(self):
+        devices = self.server.devices
+        device = None
+        while True:
+            request = self.read_request()
+            if request == "host:version":
+                self.send_okay()
+                self.request.sendall(encode_request("0029"))
+                return
+            if request == "host:devices":
+                self.send_okay()
+                self.request.sendall(encode_request("".join(f"{serial}\tdevice\n" for serial in devices)))
+                return
+            if request.startswith("host-serial:") and request.endswith(":features"):
+                serial = request[len("host-serial:"):-len(":features")]
+                if serial not in devices:
+                    self.send_fail(f"device '{serial}' not found")
+                    return
+                self.send_okay()
+                self.request.sendall(encode_request("shell_v2,cmd" if devices[serial].shell_v2 else "cmd"))
+                return
+            if request.startswith("host:transport:"):
+                serial = request[len("host:transport:"):]
+                if serial not in devices:
+                    self.send_fail(f"device '{serial}' not found")
+                    return
+                device = devices[serial]
+                self.send_okay()
+                continue
+            if device is None:
+                self.send_fail(f"unknown host service '{request}'")
+                return
+            if request.startswith("shell,v2,raw:"):
+                self.send_okay()
+                returncode, stdout, stderr = device.run(request[len("shell,v2,raw:"):])
+                for packet_id, data in ((SHELL_STDOUT, stdout), (SHELL_STDERR, stderr)):
+                    if data:
+                        self.request.sendall(struct.pack("<BI", packet_id, len(data)) + data)
+                self.request.sendall(struct.pack("<BIB", SHELL_EXIT, 1, returncode & 0xff))
+            elif request.startswith("shell:"):
+                self.send_okay()
+                _, stdout, stderr = device.run(request[len("shell:"):])
+                self.request.sendall(stdout + stderr)
+            elif request.startswith("exec:"):
+                self.send_okay()
+                _, stdout, _ = device.run(request[len("exec:"):])
+                self.request.sendall(stdout)
+            elif request == "sync:":
+                self.send_okay()
+                self.handle_sync(device)
+            else:
+                self.send_fail(f"unknown device service '{request}'")
+            return
+
+    def handle_sync(self, device):
+        while True:
+            command, size = struct.unpack("<4sI", self.read_exact(8))
+            if command == b"QUIT":
+                return
+            path = self.read_exact(size).decode("utf-8")
+            if command != b"RECV":
+                self.request.sendall(b"FAIL" + struct.pack("<I", 11) + b"unsupported")
+                return
+            data = device.read_file(path)
+            if data is None:
+                message = f"remote object '{path}' does not exist".encode("utf-8")
+                self.request.sendall(b"FAIL" + struct.pack("<I", len(message)) + message)
+                return
+            for offset in range(0, len(data), 64 * 1024):
+                chunk = data[offset:offset + 64 * 1024]
+                self.request.sendall(b"DATA" + struct.pack("<I", len(chunk)) + chunk)
+            self.request.sendall(b"DONE" + struct.pack("<I", 0))
+
+
+class FakeAdbServer(socketserver.ThreadingTCPServer):
+    # a local adb server speaking the same smart-socket protocol as the real one, so the socket backend can be
+    # exercised without a phone attached, e.g. by pointing ADB_SERVER_PORT at it
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, devices, host="127.0.0.1", port=0):
+        super().__init__((host, port), FakeAdbHandler)
+        self.devices = {device.serial: device for device in devices}
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake adb server that runs device commands on the local shell")
+    parser.add_argument("--port", type=int, default=5038)
+    parser.add_argument("--serial", default="emulator-5554")
+    args = vars(parser.parse_args())
+    server = FakeAdbServer([FakeDevice(args["serial"])], port=args["port"])
+    print(f"Fake adb server listening on 127.0.0.1:{server.port} with device {args['serial']}")
+    server.serve_forever()
@@ -0,0 +1,156 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import sys
+import time
+
+from config import load_config
+from and_controller import list_all_devices_async, AsyncAndroidController
+from task_executor import create_model, run_task
+from utils import print_with_color
+
+configs = load_config()
+
+
+def select_docs_dir(root_dir, app, docs):
+    # non-interactive version of the doc base selection in task_executor.py, "any" prefers the docs generated from
+    # autonomous exploration and falls back to the ones from human demonstration
+    app_dir = os.path.join(os.path.join(root_dir, "apps"), app)
+    auto_docs_dir = os.path.join(app_dir, "auto_docs")
+    demo_docs_dir = os.path.join(app_dir, "demo_docs")
+    if docs == "none":
+        return None
+    if docs == "demo":
+        return demo_docs_dir if os.path.exists(demo_docs_dir) else None
+    if docs == "explore":
+        return auto_docs_dir if os.path.exists(auto_docs_dir) else None
+    if os.path.exists(auto_docs_dir):
+        return auto_docs_dir
+    if os.path.exists(demo_docs_dir):
+        return demo_docs_dir
+    return None
+
+
+def load_tasks(tasks_path):
+    tasks = []
+    with open(tasks_path, "r") as infile:
+        for line in infile:
+            if not line.strip():
+                continue
+            task = json.loads(line)
+            task.setdefault("id", str(len(tasks) + 1))
+            task.setdefault("docs", "any")
+            task["app"] = task["app"].replace(" ", "")
+            tasks.append(task)
+    return tasks
+
+
+async def run_fleet_task(controller, mllm, task, work_dir, root_dir):
+    task_timestamp = int(time.time())
+    dir_name = datetime.datetime.fromtimestamp(task_timestamp).strftime(
+        f"task_{task['app']}_%Y-%m-%d_%H-%M-%S_{task['id']}")
+    task_dir = os.path.join(work_dir, dir_name)
+    os.mkdir(task_dir)
+    log_path = os.path.join(task_dir, f"log_{task['app']}_{dir_name}.txt")
+    docs_dir = select_docs_dir(root_dir, task["app"], task["docs"])
+    start = time.time()
+    try:
+        task_complete, round_count = await run_task(controller, mllm, task["task"], task_dir, dir_name, log_path,
+                                                    docs_dir)
+        if task_complete:
+            status = "completed"
+        elif round_count == configs["MAX_ROUNDS"]:
+            status = "max_rounds"
+        else:
+            status = "failed"
+    except Exception as e:
+        print_with_color(f"ERROR: Task {task['id']} raised an exception on {controller.device}: {e}", "red")
+        status, round_count = "error", 0
+    return {"id": task["id"], "app": task["app"], "task": task["task"], "device": controller.device,
+            "status": status, "rounds": round_count, "docs_dir": docs_dir, "task_dir": task_dir,
+            "start_time": start, "duration": time.time() - start}
+
+
+async def device_available(controller):
+    # a task can fail because the device went offline rather than because of the task. adb devices still lists an
+    # offline device, so the check is a shell round trip instead
+    return await controller.get_device_size() != (0, 0)
+
+
+async def device_worker(device, queue, mllm, work_dir, root_dir, results_file):
+    # each device leases tasks from the shared queue until it is empty, so throughput grows with the device count.
+    # A device that is lost mid-run hands its task back to the queue and leaves, so it does not fail every task left
+    controller = await AsyncAndroidController.create(device)
+    if not controller.width and not controller.height:
+        print_with_color(f"ERROR: Invalid device size for {device}, the device is skipped", "red")
+        return
+    print_with_color(f"Screen resolution of {device}: {controller.width}x{controller.height}", "yellow")
+    while True:
+        try:
+            task = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            break
+        print_with_color(f"Starting task {task['id']} on {device}: {task['task']}", "yellow")
+        result = await run_fleet_task(controller, mllm, task, work_dir, root_dir)
+        if result["status"] in ("failed", "error") and not await device_available(controller):
+            queue.put_nowait(task)
+            print_with_color(f"ERROR: {device} is no longer reachable, task {task['id']} is put back in the queue "
+                             f"and the device is retired", "red")
+            break
+        results_file.write(json.dumps(result) + "\n")
+        results_file.flush()
+        print_with_color(f"Task {task['id']} on {device} finished with status {result['status']} in "
+                         f"{result['duration']:.1f}s", "yellow")
+    await controller.close()
+
+
+async def main():
+    arg_desc = "AppAgent - Fleet Runner"
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, description=arg_desc)
+    parser.add_argument("--tasks", required=True, help="JSONL file with one {\"app\": ..., \"task\": ...} per line, "
+                                                       "optional keys are \"id\" and \"docs\" (any, explore, demo or "
+                                                       "none)")
+    parser.add_argument("--devices", help="Comma-separated device IDs to use, defaults to every attached device")
+    parser.add_argument("--results", help="Path of the JSONL results file")
+    parser.add_argument("--root_dir", default="./")
+    args = vars(parser.parse_args())
+
+    mllm = create_model()
+    if mllm is None:
+        sys.exit()
+
+    root_dir = args["root_dir"]
+    tasks = load_tasks(args["tasks"])
+    if args["devices"]:
+        device_list = [device.strip() for device in args["devices"].split(",") if device.strip()]
+    else:
+        device_list = await list_all_devices_async()
+    if not device_list:
+        print_with_color("ERROR: No device found!", "red")
+        sys.exit()
+    print_with_color(f"Running {len(tasks)} tasks on {len(device_list)} devices:\n{str(device_list)}", "yellow")
+
+    work_dir = os.path.join(root_dir, "tasks")
+    if not os.path.exists(work_dir):
+        os.mkdir(work_dir)
+    results_path = args["results"] or os.path.join(
+        work_dir, datetime.datetime.fromtimestamp(int(time.time())).strftime("fleet_%Y-%m-%d_%H-%M-%S.jsonl"))
+
+    queue = asyncio.Queue()
+    for task in tasks:
+        queue.put_nowait(task)
+    start = time.time()
+    with open(results_path, "a") as results_file:
+        await asyncio.gather(*[device_worker(device, queue, mllm, work_dir, root_dir, results_file)
+                               for device in device_list])
+    await mllm.close_async()
+    print_with_color(f"Model connections: {mllm.get_stats()}", "yellow")
+    if not queue.empty():
+        print_with_color(f"ERROR: {queue.qsize()} tasks were not run because no usable device was left", "red")
+    print_with_color(f"Fleet run finished in {time.time() - start:.1f}s. Results saved to {results_path}", "yellow")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,211 +1,459 @@
-import re
-from abc import abstractmethod
-from typing import List
-from http import HTTPStatus
-
-import requests
-import dashscope
-
-from utils import print_with_color, encode_image
-
-
-class BaseModel:
-    def __init__(self):
-        pass
-
-    @abstractmethod
-    def get_model_response(self, prompt: str, images: List[str]) -> (bool, str):
-        pass
-
-
-class OpenAIModel(BaseModel):
-    def __init__(self, base_url: str, api_key: str, model: str, temperature: float, max_tokens: int):
-        super().__init__()
-        self.base_url = base_url
-        self.api_key = api_key
-        self.model = model
-        self.temperature = temperature
-        self.max_tokens = max_tokens
-
-    def get_model_response(self, prompt: str, images: List[str]) -> (bool, str):
-        content = [
-            {
-                "type": "text",
-                "text": prompt
-            }
-        ]
-        for img in images:
-            base64_img = encode_image(img)
-            content.append({
-                "type": "image_url",
-                "image_url": {
-                    "url": f"data:image/jpeg;base64,{base64_img}"
-                }
-            })
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
-        payload = {
-            "model": self.model,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": content
-                }
-            ],
-            "temperature": self.temperature,
-            "max_tokens": self.max_tokens
-        }
-        response = requests.post(self.base_url, headers=headers, json=payload).json()
-        if "error" not in response:
-            usage = response["usage"]
-            prompt_tokens = usage["prompt_tokens"]
-            completion_tokens = usage["completion_tokens"]
-            print_with_color(f"Request cost is "
-                             f"${'{0:.2f}'.format(prompt_tokens / 1000 * 0.01 + completion_tokens / 1000 * 0.03)}",
-                             "yellow")
-        else:
-            return False, response["error"]["message"]
-        return True, response["choices"][0]["message"]["content"]
-
-
-class QwenModel(BaseModel):
-    def __init__(self, api_key: str, model: str):
-        super().__init__()
-        self.model = model
-        dashscope.api_key = api_key
-
-    def get_model_response(self, prompt: str, images: List[str]) -> (bool, str):
-        content = [{
-            "text": prompt
-        }]
-        for img in images:
-            img_path = f"file://{img}"
-            content.append({
-                "image": img_path
-            })
-        messages = [
-            {
-                "role": "user",
-                "content": content
-            }
-        ]
-        response = dashscope.MultiModalConversation.call(model=self.model, messages=messages)
-        if response.status_code == HTTPStatus.OK:
-            return True, response.output.choices[0].message.content[0]["text"]
-        else:
-            return False, response.message
-
-
-def parse_explore_rsp(rsp):
-    try:
-        observation = re.findall(r"Observation: (.*?)$", rsp, re.MULTILINE)[0]
-        think = re.findall(r"Thought: (.*?)$", rsp, re.MULTILINE)[0]
-        act = re.findall(r"Action: (.*?)$", rsp, re.MULTILINE)[0]
-        last_act = re.findall(r"Summary: (.*?)$", rsp, re.MULTILINE)[0]
-        print_with_color("Observation:", "yellow")
-        print_with_color(observation, "magenta")
-        print_with_color("Thought:", "yellow")
-        print_with_color(think, "magenta")
-        print_with_color("Action:", "yellow")
-        print_with_color(act, "magenta")
-        print_with_color("Summary:", "yellow")
-        print_with_color(last_act, "magenta")
-        if "FINISH" in act:
-            return ["FINISH"]
-        act_name = act.split("(")[0]
-        if act_name == "tap":
-            area = int(re.findall(r"tap\((.*?)\)", act)[0])
-            return [act_name, area, last_act]
-        elif act_name == "text":
-            input_str = re.findall(r"text\((.*?)\)", act)[0][1:-1]
-            return [act_name, input_str, last_act]
-        elif act_name == "long_press":
-            area = int(re.findall(r"long_press\((.*?)\)", act)[0])
-            return [act_name, area, last_act]
-        elif act_name == "swipe":
-            params = re.findall(r"swipe\((.*?)\)", act)[0]
-            area, swipe_dir, dist = params.split(",")
-            area = int(area)
-            swipe_dir = swipe_dir.strip()[1:-1]
-            dist = dist.strip()[1:-1]
-            return [act_name, area, swipe_dir, dist, last_act]
-        elif act_name == "grid":
-            return [act_name]
-        else:
-            print_with_color(f"ERROR: Undefined act {act_name}!", "red")
-            return ["ERROR"]
-    except Exception as e:
-        print_with_color(f"ERROR: an exception occurs while parsing the model response: {e}", "red")
-        print_with_color(rsp, "red")
-        return ["ERROR"]
-
-
-def parse_grid_rsp(rsp):
-    try:
-        observation = re.findall(r"Observation: (.*?)$", rsp, re.MULTILINE)[0]
-        think = re.findall(r"Thought: (.*?)$", rsp, re.MULTILINE)[0]
-        act = re.findall(r"Action: (.*?)$", rsp, re.MULTILINE)[0]
-        last_act = re.findall(r"Summary: (.*?)$", rsp, re.MULTILINE)[0]
-        print_with_color("Observation:", "yellow")
-        print_with_color(observation, "magenta")
-        print_with_color("Thought:", "yellow")
-        print_with_color(think, "magenta")
-        print_with_color("Action:", "yellow")
-        print_with_color(act, "magenta")
-        print_with_color("Summary:", "yellow")
-        print_with_color(last_act, "magenta")
-        if "FINISH" in act:
-            return ["FINISH"]
-        act_name = act.split("(")[0]
-        if act_name == "tap":
-            params = re.findall(r"tap\((.*?)\)", act)[0].split(",")
-            area = int(params[0].strip())
-            subarea = params[1].strip()[1:-1]
-            return [act_name + "_grid", area, subarea, last_act]
-        elif act_name == "long_press":
-            params = re.findall(r"long_press\((.*?)\)", act)[0].split(",")
-            area = int(params[0].strip())
-            subarea = params[1].strip()[1:-1]
-            return [act_name + "_grid", area, subarea, last_act]
-        elif act_name == "swipe":
-            params = re.findall(r"swipe\((.*?)\)", act)[0].split(",")
-            start_area = int(params[0].strip())
-            start_subarea = params[1].strip()[1:-1]
-            end_area = int(params[2].strip())
-            end_subarea = params[3].strip()[1:-1]
-            return [act_name + "_grid", start_area, start_subarea, end_area, end_subarea, last_act]
-        elif act_name == "grid":
-            return [act_name]
-        else:
-            print_with_color(f"ERROR: Undefined act {act_name}!", "red")
-            return ["ERROR"]
-    except Exception as e:
-        print_with_color(f"ERROR: an exception occurs while parsing the model response: {e}", "red")
-        print_with_color(rsp, "red")
-        return ["ERROR"]
-
-
-def parse_reflect_rsp(rsp):
-    try:
-        decision = re.findall(r"Decision: (.*?)$", rsp, re.MULTILINE)[0]
-        think = re.findall(r"Thought: (.*?)$", rsp, re.MULTILINE)[0]
-        print_with_color("Decision:", "yellow")
-        print_with_color(decision, "magenta")
-        print_with_color("Thought:", "yellow")
-        print_with_color(think, "magenta")
-        if decision == "INEFFECTIVE":
-            return [decision, think]
-        elif decision == "BACK" or decision == "CONTINUE" or decision == "SUCCESS":
-            doc = re.findall(r"Documentation: (.*?)$", rsp, re.MULTILINE)[0]
-            print_with_color("Documentation:", "yellow")
-            print_with_color(doc, "magenta")
-            return [decision, think, doc]
-        else:
-            print_with_color(f"ERROR: Undefined decision {decision}!", "red")
-            return ["ERROR"]
-    except Exception as e:
-        print_with_color(f"ERROR: an exception occurs while parsing the model response: {e}", "red")
-        print_with_color(rsp, "red")
-        return ["ERROR"]
+import asyncio
+import json
+import os
+import random
+import re
+import time
+from abc import abstractmethod
+from typing import Callable, List, Union
+from http import HTTPStatus
+
+import aiohttp
+import dashscope
+
+from rate_limiter import RateLimiter, estimate_image_tokens, parse_retry_after
+from utils import print_with_color, encode_image, run_sync, ImageEncoder, MemoryImage
+
+
+# a read timeout means the request was sent and may have been processed and billed, so unlike a failure to connect
+# it is not retried. Before aiohttp 3.10 connect and read timeouts share ServerTimeoutError and neither is retried
+READ_TIMEOUT_ERROR = getattr(aiohttp, "SocketTimeoutError", aiohttp.ServerTimeoutError)
+
+
+class BaseModel:
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, max_retries: int = 3, retry_backoff: float = 1, rate_limiter: RateLimiter = None):
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.rate_limiter = rate_limiter
+        self.stats = {"requests": 0, "retries": 0, "failures": 0}
+
+    @abstractmethod
+    async def get_model_response_async(self, prompt: str, images: List[Union[str, MemoryImage]],
+                                       on_text: Callable[[str], None] = None) -> (bool, str):
+        # a model that streams its responses passes every piece of the text to on_text as it arrives, before the
+        # complete response is returned. Models that do not stream never call it
+        pass
+
+    def get_model_response(self, prompt: str, images: List[Union[str, MemoryImage]]) -> (bool, str):
+        return run_sync(self.get_model_response_async(prompt, images))
+
+    def get_cache_params(self) -> dict:
+        # everything besides the prompt and the images that the response depends on
+        return {"class": type(self).__name__}
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        if self.rate_limiter is not None:
+            stats["rate_limiter"] = self.rate_limiter.stats()
+        return stats
+
+    async def close_async(self):
+        pass
+
+    async def send_with_retries(self, send, estimated_tokens=0):
+        # send() makes one attempt and returns the response, its HTTP status and the Retry-After seconds or None.
+        # Connection errors and overload or server error statuses are retried after Retry-After seconds or with
+        # exponential backoff, a 429 also pauses the other clients of the key. Read timeouts and broken responses are
+        # not retried. A request that still fails is returned in the same form as an error reported by the API
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire(estimated_tokens)
+            self.stats["requests"] += 1
+            status, retry_after = None, None
+            try:
+                response, status, retry_after = await send()
+                if status not in self.RETRY_STATUSES or attempt == self.max_retries:
+                    if "error" in response:
+                        self.stats["failures"] += 1
+                    return response
+                error = f"HTTP {status}"
+            except (READ_TIMEOUT_ERROR, aiohttp.ClientPayloadError) as e:
+                self.stats["failures"] += 1
+                return {"error": {"message": f"The model request failed while reading the response: "
+                                             f"{str(e) or type(e).__name__}"}}
+            except aiohttp.ClientConnectionError as e:
+                error = str(e) or type(e).__name__
+                if attempt == self.max_retries:
+                    self.stats["failures"] += 1
+                    return {"error": {"message": f"The model request failed after {attempt + 1} attempts: {error}"}}
+            self.stats["retries"] += 1
+            delay = retry_after
+            if delay is None:
+                delay = self.retry_backoff * 2 ** attempt * random.uniform(0.5, 1)
+            if status == 429 and self.rate_limiter is not None:
+                await asyncio.to_thread(self.rate_limiter.rate_limited_response, delay)
+            print_with_color(f"The model request failed ({error}), retrying in {delay:.1f}s", "yellow")
+            await asyncio.sleep(delay)
+
+    def close(self):
+        run_sync(self.close_async())
+
+
+class OpenAIModel(BaseModel):
+    # requests go through one pooled aiohttp session per model, so consecutive rounds and all the agents sharing the
+    # model reuse open keep-alive connections instead of doing a new TCP and TLS handshake for every request. Requests
+    # wait for the rate limiter, which is shared by every client of the API key. With stream on, the responses of
+    # callers that pass on_text are streamed as server-sent events
+    def __init__(self, base_url: str, api_key: str, model: str, temperature: float, max_tokens: int,
+                 image_encoder: ImageEncoder = None, pool_size: int = 10, connect_timeout: float = 10,
+                 read_timeout: float = 120, max_retries: int = 3, retry_backoff: float = 1,
+                 rate_limiter: RateLimiter = None, stream: bool = False):
+        super().__init__(max_retries, retry_backoff, rate_limiter)
+        self.base_url = base_url
+        self.api_key = api_key
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.image_encoder = image_encoder or ImageEncoder()
+        self.pool_size = pool_size
+        self.timeout = aiohttp.ClientTimeout(total=None, connect=connect_timeout, sock_read=read_timeout)
+        self.stream = stream
+        self.session = None
+        self.session_loop = None
+        self.stats.update(new_connections=0, reused_connections=0)
+        self.first_token_times = []
+
+    def get_session(self):
+        # a session belongs to the event loop it was created on, the sync API runs on a different loop than asyncio.run
+        loop = asyncio.get_running_loop()
+        if self.session is None or self.session.closed or self.session_loop is not loop:
+            trace_config = aiohttp.TraceConfig()
+            trace_config.on_connection_create_end.append(self.on_connection_created)
+            trace_config.on_connection_reuseconn.append(self.on_connection_reused)
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size),
+                                                 timeout=self.timeout, trace_configs=[trace_config])
+            self.session_loop = loop
+        return self.session
+
+    async def on_connection_created(self, session, context, params):
+        self.stats["new_connections"] += 1
+
+    async def on_connection_reused(self, session, context, params):
+        self.stats["reused_connections"] += 1
+
+    def get_cache_params(self):
+        return {"class": type(self).__name__, "base_url": self.base_url, "model": self.model,
+                "temperature": self.temperature, "max_tokens": self.max_tokens, "image_encoder": self.image_encoder.key}
+
+    def get_stats(self):
+        stats = super().get_stats()
+        if self.first_token_times:
+            stats["time_to_first_token"] = f"{sum(self.first_token_times) / len(self.first_token_times):.2f}s " \
+                                           f"average over {len(self.first_token_times)} streams"
+        return stats
+
+    async def close_async(self):
+        if self.session is not None and self.session_loop is asyncio.get_running_loop():
+            await self.session.close()
+        self.session = None
+
+    async def read_stream(self, resp, on_text, start):
+        # reads the server-sent events of a streamed completion and passes every content delta to on_text. The result
+        # has the form of a complete response. Once text was passed on, a broken stream is not retried, as the caller
+        # may already have acted on it. A stream that ends without [DONE] or a finish reason is incomplete
+        content = []
+        usage = None
+        finished = False
+        try:
+            async for line in resp.content:
+                line = line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    finished = True
+                    break
+                try:
+                    chunk = json.loads(data)
+                except ValueError:
+                    return {"error": {"message": f"Malformed event in the model response stream: {data[:500]}"}}
+                if "error" in chunk:
+                    return chunk
+                usage = chunk.get("usage") or usage
+                for choice in chunk.get("choices") or []:
+                    finished = finished or bool(choice.get("finish_reason"))
+                    text = (choice.get("delta") or {}).get("content")
+                    if not text:
+                        continue
+                    if not content:
+                        self.first_token_times.append(time.time() - start)
+                        print_with_color(f"First token after {self.first_token_times[-1]:.2f}s", "yellow")
+                    content.append(text)
+                    on_text(text)
+        except aiohttp.ClientConnectionError as e:
+            if not content:
+                raise
+            return {"error": {"message": f"The model response stream broke off: {str(e) or type(e).__name__}"}}
+        if not finished:
+            return {"error": {"message": "The model response stream ended before the response was complete"}}
+        return {"choices": [{"message": {"content": "".join(content)}}], "usage": usage}
+
+    async def post(self, headers, body, estimated_tokens=0, on_text=None):
+        # one request through send_with_retries, on_text is set for a streamed request
+        async def send():
+            start = time.time()
+            async with self.get_session().post(self.base_url, headers=headers, data=body) as resp:
+                retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                if self.rate_limiter is not None:
+                    await asyncio.to_thread(self.rate_limiter.update_from_headers, resp.headers)
+                if on_text is not None and resp.status == 200:
+                    return await self.read_stream(resp, on_text, start), resp.status, retry_after
+                text = await resp.text()
+                try:
+                    response = json.loads(text)
+                except ValueError:
+                    response = {}
+                if not isinstance(response, dict) or resp.status >= 400 and "error" not in response:
+                    response = {"error": {"message": f"HTTP {resp.status}: {text[:500]}"}}
+                return response, resp.status, retry_after
+
+        return await self.send_with_retries(send, estimated_tokens)
+
+    async def get_model_response_async(self, prompt: str, images: List[Union[str, MemoryImage]],
+                                       on_text: Callable[[str], None] = None) -> (bool, str):
+        content = [
+            {
+                "type": "text",
+                "text": prompt
+            }
+        ]
+        encoded_images = []
+        for img in images:
+            # images are file paths or MemoryImage objects, which keep their encoded form for later requests
+            encoded = await asyncio.to_thread(encode_image, img, self.image_encoder)
+            encoded_images.append(encoded)
+            content.append({
+                "type": "image_url",
+                "image_url": {
+                    "url": encoded.get_data_url()
+                }
+            })
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+        payload = {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": content
+                }
+            ],
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens
+        }
+        if not self.stream:
+            on_text = None
+        if on_text is not None:
+            payload["stream"] = True
+            payload["stream_options"] = {"include_usage": True}
+        body = json.dumps(payload)
+        print_with_color(f"Request payload is {len(body) / 1024:.1f} KB with images "
+                         f"{', '.join(str(encoded) for encoded in encoded_images) or 'none'}", "yellow")
+        # rough upper bound of the tokens the request uses, corrected with the actual usage once the response is in
+        estimated_tokens = len(prompt) // 4 + self.max_tokens + sum(estimate_image_tokens(*encoded.size)
+                                                                    for encoded in encoded_images)
+        response = await self.post(headers, body, estimated_tokens, on_text)
+        if "error" not in response:
+            # an API that does not support stream_options reports no usage for a streamed response
+            usage = response["usage"]
+            if usage:
+                prompt_tokens = usage["prompt_tokens"]
+                completion_tokens = usage["completion_tokens"]
+                if self.rate_limiter is not None:
+                    await asyncio.to_thread(self.rate_limiter.record_usage, prompt_tokens + completion_tokens,
+                                            estimated_tokens)
+                print_with_color(f"Request cost is "
+                                 f"${'{0:.2f}'.format(prompt_tokens / 1000 * 0.01 + completion_tokens / 1000 * 0.03)}",
+                                 "yellow")
+        else:
+            return False, response["error"]["message"]
+        return True, response["choices"][0]["message"]["content"]
+
+
+class QwenModel(BaseModel):
+    def __init__(self, api_key: str, model: str, max_retries: int = 3, retry_backoff: float = 1,
+                 rate_limiter: RateLimiter = None):
+        super().__init__(max_retries, retry_backoff, rate_limiter)
+        self.model = model
+        dashscope.api_key = api_key
+
+    def get_cache_params(self):
+        return {"class": type(self).__name__, "model": self.model}
+
+    async def get_model_response_async(self, prompt: str, images: List[Union[str, MemoryImage]],
+                                       on_text: Callable[[str], None] = None) -> (bool, str):
+        content = [{
+            "text": prompt
+        }]
+        temp_paths = []
+        for img in images:
+            if isinstance(img, MemoryImage):
+                img, temporary = await asyncio.to_thread(img.get_path)
+                if temporary:
+                    temp_paths.append(img)
+            img_path = f"file://{img}"
+            content.append({
+                "image": img_path
+            })
+        messages = [
+            {
+                "role": "user",
+                "content": content
+            }
+        ]
+
+        async def send():
+            response = await dashscope.AioMultiModalConversation.call(model=self.model, messages=messages)
+            if response.status_code == HTTPStatus.OK:
+                return {"text": response.output.choices[0].message.content[0]["text"]}, response.status_code, None
+            return {"error": {"message": response.message}}, response.status_code, None
+
+        try:
+            response = await self.send_with_retries(send, len(prompt) // 4)
+        finally:
+            # the images that were only written for this request, e.g. with SAVE_IMAGES off, are not kept
+            for path in temp_paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        if "error" in response:
+            return False, response["error"]["message"]
+        return True, response["text"]
+
+
+class ResponseParser:
+    # collects the "Field: value" lines of a response that arrives in pieces, a field is complete once its line has
+    # ended. Like the parse functions below it keeps the first value of every field
+    FIELDS = re.compile(r"(Observation|Thought|Action|Summary|Decision|Documentation): (.*?)$")
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields = {}
+
+    def feed(self, text):
+        # returns the fields completed by text
+        self.buffer += text
+        *lines, self.buffer = self.buffer.split("\n")
+        completed = {}
+        for line in lines:
+            match = self.FIELDS.search(line)
+            if match and match.group(1) not in self.fields:
+                self.fields[match.group(1)] = completed[match.group(1)] = match.group(2)
+        return completed
+
+
+def parse_explore_act(act):
+    # the action of an Action line without the summary, raises an exception if its parameters are malformed
+    if "FINISH" in act:
+        return ["FINISH"]
+    act_name = act.split("(")[0]
+    if act_name == "tap":
+        area = int(re.findall(r"tap\((.*?)\)", act)[0])
+        return [act_name, area]
+    elif act_name == "text":
+        input_str = re.findall(r"text\((.*?)\)", act)[0][1:-1]
+        return [act_name, input_str]
+    elif act_name == "long_press":
+        area = int(re.findall(r"long_press\((.*?)\)", act)[0])
+        return [act_name, area]
+    elif act_name == "swipe":
+        params = re.findall(r"swipe\((.*?)\)", act)[0]
+        area, swipe_dir, dist = params.split(",")
+        area = int(area)
+        swipe_dir = swipe_dir.strip()[1:-1]
+        dist = dist.strip()[1:-1]
+        return [act_name, area, swipe_dir, dist]
+    elif act_name == "grid":
+        return [act_name]
+    else:
+        return ["ERROR"]
+
+
+def parse_grid_act(act):
+    if "FINISH" in act:
+        return ["FINISH"]
+    act_name = act.split("(")[0]
+    if act_name == "tap":
+        params = re.findall(r"tap\((.*?)\)", act)[0].split(",")
+        area = int(params[0].strip())
+        subarea = params[1].strip()[1:-1]
+        return [act_name + "_grid", area, subarea]
+    elif act_name == "long_press":
+        params = re.findall(r"long_press\((.*?)\)", act)[0].split(",")
+        area = int(params[0].strip())
+        subarea = params[1].strip()[1:-1]
+        return [act_name + "_grid", area, subarea]
+    elif act_name == "swipe":
+        params = re.findall(r"swipe\((.*?)\)", act)[0].split(",")
+        start_area = int(params[0].strip())
+        start_subarea = params[1].strip()[1:-1]
+        end_area = int(params[2].strip())
+        end_subarea = params[3].strip()[1:-1]
+        return [act_name + "_grid", start_area, start_subarea, end_area, end_subarea]
+    elif act_name == "grid":
+        return [act_name]
+    else:
+        return ["ERROR"]
+
+
+def parse_action_rsp(rsp, parse_act):
+    try:
+        observation = re.findall(r"Observation: (.*?)$", rsp, re.MULTILINE)[0]
+        think = re.findall(r"Thought: (.*?)$", rsp, re.MULTILINE)[0]
+        act = re.findall(r"Action: (.*?)$", rsp, re.MULTILINE)[0]
+        last_act = re.findall(r"Summary: (.*?)$", rsp, re.MULTILINE)[0]
+        print_with_color("Observation:", "yellow")
+        print_with_color(observation, "magenta")
+        print_with_color("Thought:", "yellow")
+        print_with_color(think, "magenta")
+        print_with_color("Action:", "yellow")
+        print_with_color(act, "magenta")
+        print_with_color("Summary:", "yellow")
+        print_with_color(last_act, "magenta")
+        res = parse_act(act)
+        if res[0] == "ERROR":
+            print_with_color(f"ERROR: Undefined act {act.split('(')[0]}!", "red")
+        if res[0] in ("FINISH", "grid", "ERROR"):
+            return res
+        return res + [last_act]
+    except Exception as e:
+        print_with_color(f"ERROR: an exception occurs while parsing the model response: {e}", "red")
+        print_with_color(rsp, "red")
+        return ["ERROR"]
+
+
+def parse_explore_rsp(rsp):
+    return parse_action_rsp(rsp, parse_explore_act)
+
+
+def parse_grid_rsp(rsp):
+    return parse_action_rsp(rsp, parse_grid_act)
+
+
+def parse_reflect_rsp(rsp):
+    try:
+        decision = re.findall(r"Decision: (.*?)$", rsp, re.MULTILINE)[0]
+        think = re.findall(r"Thought: (.*?)$", rsp, re.MULTILINE)[0]
+        print_with_color("Decision:", "yellow")
+        print_with_color(decision, "magenta")
+        print_with_color("Thought:", "yellow")
+        print_with_color(think, "magenta")
+        if decision == "INEFFECTIVE":
+            return [decision, think]
+        elif decision == "BACK" or decision == "CONTINUE" or decision == "SUCCESS":
+            doc = re.findall(r"Documentation: (.*?)$", rsp, re.MULTILINE)[0]
+            print_with_color("Documentation:", "yellow")
+            print_with_color(doc, "magenta")
+            return [decision, think, doc]
+        else:
+            print_with_color(f"ERROR: Undefined decision {decision}!", "red")
+            return ["ERROR"]
+    except Exception as e:
+        print_with_color(f"ERROR: an exception occurs while parsing the model response: {e}", "red")
+        print_with_color(rsp, "red")
+        return ["ERROR"]
@@ -35,11 +35,11 @@ class OpenAIModel(BaseModel):
             }
         ]
         for img in images:
-            base64_img = encode_image(img)
+            encoded = encode_image(img)
             content.append({
                 "type": "image_url",
                 "image_url": {
-                    "url": f"data:image/jpeg;base64,{base64_img}"
+                    "url": encoded.get_data_url()
                 }
             })
         headers = {
@@ -0,0 +1,85 @@
+import collections
+
+import cv2
+import numpy as np
+
+from config import load_config
+from utils import MemoryImage
+
+configs = load_config()
+
+
+def perceptual_hash(img, hash_size=16):
+    # difference hash of the screenshot: one bit per pixel of a tiny grayscale thumbnail telling whether it is brighter
+    # than its right neighbor, so compression noise does not change it but a different screen does
+    if isinstance(img, str):
+        gray = cv2.imread(img, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    elif isinstance(img, MemoryImage):
+        gray = img.get_thumbnail()
+    elif img.ndim == 3:
+        gray = cv2.cvtColor(img, cv2.COLOR_RGBA2GRAY if img.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+    else:
+        gray = img
+    if gray is None:
+        return None
+    thumbnail = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    return int.from_bytes(np.packbits(thumbnail[:, 1:] > thumbnail[:, :-1]).tobytes(), "big")
+
+
+def images_match(img, other, max_distance=None):
+    max_distance = configs["SCREEN_HASH_DISTANCE"] if max_distance is None else max_distance
+    image_hash, other_hash = perceptual_hash(img), perceptual_hash(other)
+    if image_hash is None or other_hash is None:
+        return False
+    return bin(image_hash ^ other_hash).count("1") <= max_distance
+
+
+class ScreenFingerprint:
+    # the content hash covers the node texts that the structure hash ignores, a screen whose text changed, e.g. after
+    # typing into a field, is a different screen even if its screenshot differs by only a few hash bits
+    def __init__(self, structure_hash, image_hash, content_hash=None):
+        self.structure_hash = structure_hash
+        self.image_hash = image_hash
+        self.content_hash = content_hash
+
+    def matches(self, other, max_distance=0):
+        if self.structure_hash != other.structure_hash or self.content_hash != other.content_hash \
+                or self.image_hash is None or other.image_hash is None:
+            return False
+        return bin(self.image_hash ^ other.image_hash).count("1") <= max_distance
+
+
+class ObservationCache:
+    # LRU cache of what was derived from a screen, e.g. its element list and labeled screenshot. Entries are keyed by
+    # the structural hash of the hierarchy and a variant for anything else the value depends on, and the perceptual
+    # hash of the screenshot must be within max_distance bits as well for a hit
+    def __init__(self, max_size=None, max_distance=None):
+        self.max_size = configs["OBSERVATION_CACHE_SIZE"] if max_size is None else max_size
+        self.max_distance = configs["SCREEN_HASH_DISTANCE"] if max_distance is None else max_distance
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, fingerprint, variant=None):
+        key = (fingerprint.structure_hash, variant)
+        entry = self.entries.get(key)
+        if entry is None or not entry[0].matches(fingerprint, self.max_distance):
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, fingerprint, value, variant=None):
+        if self.max_size <= 0:
+            return
+        key = (fingerprint.structure_hash, variant)
+        self.entries[key] = (fingerprint, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0
+        return f"{self.hits} hits, {self.misses} misses ({hit_rate:.0%} hit rate)"
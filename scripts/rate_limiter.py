@@ -0,0 +1,198 @@
+import asyncio
+import email.utils
+import hashlib
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+
+from config import load_config
+from utils import print_with_color
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+configs = load_config()
+
+DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value):
+    # rate limit reset headers look like 1s, 6m0s or 20ms, a plain number is taken as seconds
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    matches = DURATION_PATTERN.findall(value)
+    if not matches:
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in matches)
+
+
+def parse_retry_after(value):
+    # Retry-After is either a number of seconds or an HTTP date
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_image_tokens(width, height):
+    # vision token cost of a high detail image: it is fit into 2048x2048, its shorter side scaled to 768 and every
+    # 512x512 tile costs 170 tokens on top of a base of 85
+    scale = min(1, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    if min(width, height) > 768:
+        scale = 768 / min(width, height)
+        width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+class RateLimiter:
+    # token buckets on requests and tokens per minute for every client of one API key. The bucket levels live in a
+    # state file guarded by an exclusive file lock, so all the threads and processes using the key draw from the same
+    # budget, and a rate limit reported by the API pauses all of them. Without fcntl (Windows) the state is only
+    # shared within the process. A limit of 0 turns its bucket off
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, state_path=None):
+        self.requests_per_minute = configs["MODEL_RPM"] if requests_per_minute is None else requests_per_minute
+        self.tokens_per_minute = configs["MODEL_TPM"] if tokens_per_minute is None else tokens_per_minute
+        self.state_path = state_path if fcntl is not None else None
+        self.state = None
+        self.lock = threading.Lock()
+        self.waits = 0
+        self.wait_time = 0.0
+        self.rate_limited = 0
+
+    @classmethod
+    def for_key(cls, api_key, base_url, requests_per_minute=None, tokens_per_minute=None):
+        # the state file is named after the API key and endpoint, so limiters of the same key find each other
+        key = hashlib.sha256(f"{base_url}\n{api_key}".encode("utf-8")).hexdigest()[:16]
+        state_dir = configs["MODEL_RATE_LIMIT_DIR"] or tempfile.gettempdir()
+        return cls(requests_per_minute, tokens_per_minute, os.path.join(state_dir, f"appagent_rate_limit_{key}.json"))
+
+    def initial_state(self, now):
+        return {"requests": self.requests_per_minute, "tokens": self.tokens_per_minute, "updated": now,
+                "blocked_until": 0}
+
+    def update(self, func):
+        # runs func on the refilled shared state and writes the state back while holding the lock
+        now = time.time()
+        with self.lock:
+            if self.state_path is None:
+                if self.state is None:
+                    self.state = self.initial_state(now)
+                self.refill(self.state, now)
+                return func(self.state, now)
+            with open(self.state_path, "a+b") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                f.seek(0)
+                try:
+                    state = json.loads(f.read() or b"null") or self.initial_state(now)
+                except ValueError:
+                    state = self.initial_state(now)
+                self.refill(state, now)
+                result = func(state, now)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state).encode("utf-8"))
+                return result
+
+    def refill(self, state, now):
+        elapsed = max(0.0, now - state["updated"])
+        state["requests"] = min(self.requests_per_minute, state["requests"] + elapsed * self.requests_per_minute / 60)
+        state["tokens"] = min(self.tokens_per_minute, state["tokens"] + elapsed * self.tokens_per_minute / 60)
+        state["updated"] = now
+
+    def reserve(self, tokens):
+        # takes one request and the estimated tokens if both buckets hold enough and returns 0, or returns the time to
+        # wait before trying again
+        tokens = min(tokens, self.tokens_per_minute)
+
+        def reserve_state(state, now):
+            wait = state["blocked_until"] - now
+            if wait > 0:
+                return wait
+            wait = 0
+            if self.requests_per_minute > 0:
+                wait = max(wait, (1 - state["requests"]) * 60 / self.requests_per_minute)
+            if self.tokens_per_minute > 0:
+                wait = max(wait, (tokens - state["tokens"]) * 60 / self.tokens_per_minute)
+            if wait > 0:
+                return wait
+            if self.requests_per_minute > 0:
+                state["requests"] -= 1
+            if self.tokens_per_minute > 0:
+                state["tokens"] -= tokens
+            return 0
+
+        return self.update(reserve_state)
+
+    async def acquire(self, tokens=0):
+        start = time.time()
+        while True:
+            wait = await asyncio.to_thread(self.reserve, tokens)
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        waited = time.time() - start
+        if waited > 0.01:
+            self.waits += 1
+            self.wait_time += waited
+        return waited
+
+    def record_usage(self, tokens, estimated_tokens):
+        # corrects the token bucket once the actual usage of a request is known
+        if self.tokens_per_minute <= 0:
+            return
+
+        def correct(state, now):
+            state["tokens"] = min(self.tokens_per_minute, state["tokens"] - (tokens - estimated_tokens))
+
+        self.update(correct)
+
+    def block(self, delay):
+        # pauses every client of the key, e.g. after an HTTP 429 or when the API reports an exhausted limit
+        def block_state(state, now):
+            state["blocked_until"] = max(state["blocked_until"], now + delay)
+
+        self.update(block_state)
+
+    def update_from_headers(self, headers):
+        # the x-ratelimit headers of OpenAI compatible APIs tell how much of the quota is left and when it resets, an
+        # exhausted quota pauses every client of the key until the reset
+        delays = []
+        for kind in ("requests", "tokens"):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            reset = headers.get(f"x-ratelimit-reset-{kind}")
+            if remaining is None or reset is None:
+                continue
+            try:
+                remaining = float(remaining)
+            except ValueError:
+                continue
+            reset = parse_duration(reset)
+            if remaining <= 0 and reset:
+                delays.append(reset)
+        if delays:
+            print_with_color(f"The model API quota is used up, pausing requests for {max(delays):.1f}s", "yellow")
+            self.block(max(delays))
+
+    def rate_limited_response(self, delay):
+        # called after an HTTP 429, delay is the Retry-After of the response or the backoff of the request
+        self.rate_limited += 1
+        self.block(delay)
+
+    def stats(self):
+        return f"{self.waits} waits for {self.wait_time:.1f}s, {self.rate_limited} rate limited responses"
@@ -0,0 +1,165 @@
+import asyncio
+import collections
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Callable, List, Union
+
+from config import load_config
+from model import BaseModel
+from utils import print_with_color, MemoryImage
+
+configs = load_config()
+
+
+def get_image_digest(img):
+    if isinstance(img, MemoryImage):
+        return img.get_digest()
+    return MemoryImage.from_file(img).get_digest()
+
+
+def get_request_key(params, prompt, image_digests):
+    # content address of a request: the model parameters, the prompt and the content of every image in order
+    request = json.dumps({"params": params, "prompt": prompt, "images": image_digests}, sort_keys=True)
+    return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    # model responses by request key in two tiers: an LRU dict of the most recent max_entries responses, and an
+    # optional SQLite file shared by runs and processes that is trimmed to max_bytes by evicting the least recently
+    # used responses. Responses older than ttl seconds are expired in both tiers, 0 turns ttl or max_bytes off
+    def __init__(self, path=None, max_entries=None, max_bytes=None, ttl=None):
+        self.path = configs["MODEL_CACHE_PATH"] if path is None else path
+        self.max_entries = configs["MODEL_CACHE_MEMORY_SIZE"] if max_entries is None else max_entries
+        self.max_bytes = configs["MODEL_CACHE_MAX_MB"] * 1024 * 1024 if max_bytes is None else max_bytes
+        self.ttl = configs["MODEL_CACHE_TTL"] if ttl is None else ttl
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.db = None
+        if self.path:
+            self.db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+                            "size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)")
+            self.db.commit()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def is_expired(self, created, now):
+        return self.ttl > 0 and now - created > self.ttl
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and not self.is_expired(entry[1], now):
+                self.entries.move_to_end(key)
+                self.memory_hits += 1
+                return entry[0]
+            self.entries.pop(key, None)
+            if self.db is not None:
+                row = self.db.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None and not self.is_expired(row[1], now):
+                    self.db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                    self.db.commit()
+                    self.put_memory(key, row[0], row[1])
+                    self.disk_hits += 1
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def put_memory(self, key, response, created):
+        if self.max_entries <= 0:
+            return
+        self.entries[key] = (response, created)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def put(self, key, response):
+        now = time.time()
+        with self.lock:
+            self.put_memory(key, response, now)
+            if self.db is None:
+                return
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                            (key, response, len(response.encode("utf-8")), now, now))
+            self.evict(now)
+            self.db.commit()
+
+    def evict(self, now):
+        if self.ttl > 0:
+            self.evictions += self.db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,)).rowcount
+        if self.max_bytes <= 0:
+            return
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in self.db.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self.db.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self.evictions += len(evicted)
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+    def stats(self):
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.misses
+        hit_rate = hits / total if total else 0
+        return f"{self.memory_hits} memory hits, {self.disk_hits} disk hits, {self.misses} misses " \
+               f"({hit_rate:.0%} hit rate), {self.evictions} evictions"
+
+
+class CachedModel(BaseModel):
+    # wraps any BaseModel and answers a request that was seen before from the cache. mode is on, refresh or bypass:
+    # refresh always asks the model and overwrites the cached response, bypass neither reads nor writes the cache.
+    # Only successful responses are cached
+    MODES = ("on", "refresh", "bypass")
+
+    def __init__(self, model: BaseModel, cache: ResponseCache = None, mode: str = "on"):
+        super().__init__()
+        if mode not in self.MODES:
+            raise ValueError(f"Unsupported cache mode {mode}, must be one of {', '.join(self.MODES)}")
+        self.model = model
+        self.cache = cache or ResponseCache()
+        self.mode = mode
+
+    async def get_model_response_async(self, prompt: str, images: List[Union[str, MemoryImage]],
+                                       on_text: Callable[[str], None] = None) -> (bool, str):
+        # a cached response is returned complete, only the requests that reach the model are streamed
+        if self.mode == "bypass":
+            return await self.model.get_model_response_async(prompt, images, on_text)
+        image_digests = [await asyncio.to_thread(get_image_digest, img) for img in images]
+        key = get_request_key(self.model.get_cache_params(), prompt, image_digests)
+        if self.mode == "on":
+            response = await asyncio.to_thread(self.cache.get, key)
+            if response is not None:
+                print_with_color("The model response is taken from the cache", "yellow")
+                return True, response
+        status, rsp = await self.model.get_model_response_async(prompt, images, on_text)
+        if status:
+            await asyncio.to_thread(self.cache.put, key, rsp)
+        return status, rsp
+
+    def get_cache_params(self):
+        return self.model.get_cache_params()
+
+    def get_stats(self):
+        stats = self.model.get_stats()
+        stats["cache"] = self.cache.stats()
+        return stats
+
+    async def close_async(self):
+        await self.model.close_async()
+        self.cache.close()
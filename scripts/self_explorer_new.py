@@ -10,6 +10,8 @@ import prompts_new as prompts
 from and_controller import list_all_devices, AndroidController
 from config import load_config
 from model_new import parse_explore_rsp, OpenAIModel, QwenModel
+from rate_limiter import RateLimiter
+from utils import run_sync
 from utils_new import print_with_color, normalized_to_pixel
 
 arg_desc = "AppAgent - Autonomous Exploration"
@@ -26,9 +28,11 @@ if configs["MODEL"] == "OpenAI":
                        model=configs["OPENAI_API_MODEL"],
                        temperature=configs["TEMPERATURE"],
                        max_tokens=configs["MAX_TOKENS"])
+    rate_limiter = RateLimiter.for_key(configs["OPENAI_API_KEY"], configs["OPENAI_API_BASE"])
 elif configs["MODEL"] == "Qwen":
     mllm = QwenModel(api_key=configs["DASHSCOPE_API_KEY"],
                      model=configs["QWEN_MODEL"])
+    rate_limiter = RateLimiter.for_key(configs["DASHSCOPE_API_KEY"], "dashscope")
 else:
     print_with_color(f"ERROR: Unsupported model type {configs['MODEL']}!", "red")
     sys.exit()
@@ -94,6 +98,8 @@ while round_count < configs["MAX_ROUNDS"]:
     prompt = re.sub(r"<task_description>", task_desc, prompts.self_explore_task_template)
     base64_img = os.path.join(task_dir, f"{round_count}.png")
     print_with_color("Thinking about what to do in the next step...", "yellow")
+    # the requests share the MODEL_RPM budget of the key with every other agent instead of sleeping between rounds
+    run_sync(rate_limiter.acquire())
     status, rsp = mllm.get_model_response(prompt, [base64_img])
 
     if status:
@@ -116,6 +122,7 @@ while round_count < configs["MAX_ROUNDS"]:
                 break
         elif act_name == "text":
             _, input_str, display_name = res
+            run_sync(rate_limiter.acquire())
             status, rsp = mllm.get_model_response("Guide me to the location of " +  display_name + " within the image by providing its bounding boxes.", [base64_img])
             if status:
                 normalized = re.findall(r"\[\[(.*)]]", rsp)[0]
@@ -156,7 +163,9 @@ while round_count < configs["MAX_ROUNDS"]:
         #         break
         else:
             break
-        time.sleep(configs["REQUEST_INTERVAL"])
+        # the next screenshot waits for the screen to settle after the action, the model requests are paced
+        # separately by the rate limiter
+        controller.wait_for_settle()
     else:
         print_with_color(rsp, "red")
         break
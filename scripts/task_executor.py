@@ -1,291 +1,393 @@
-import argparse
-import ast
-import datetime
-import json
-import os
-import re
-import sys
-import time
-
-import prompts
-from config import load_config
-from and_controller import list_all_devices, AndroidController, traverse_tree
-from model import parse_explore_rsp, parse_grid_rsp, OpenAIModel, QwenModel
-from utils import print_with_color, draw_bbox_multi, draw_grid
-
-arg_desc = "AppAgent Executor"
-parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, description=arg_desc)
-parser.add_argument("--app")
-parser.add_argument("--root_dir", default="./")
-args = vars(parser.parse_args())
-
-configs = load_config()
-
-if configs["MODEL"] == "OpenAI":
-    mllm = OpenAIModel(base_url=configs["OPENAI_API_BASE"],
-                       api_key=configs["OPENAI_API_KEY"],
-                       model=configs["OPENAI_API_MODEL"],
-                       temperature=configs["TEMPERATURE"],
-                       max_tokens=configs["MAX_TOKENS"])
-elif configs["MODEL"] == "Qwen":
-    mllm = QwenModel(api_key=configs["DASHSCOPE_API_KEY"],
-                     model=configs["QWEN_MODEL"])
-else:
-    print_with_color(f"ERROR: Unsupported model type {configs['MODEL']}!", "red")
-    sys.exit()
-
-app = args["app"]
-root_dir = args["root_dir"]
-
-if not app:
-    print_with_color("What is the name of the app you want me to operate?", "blue")
-    app = input()
-    app = app.replace(" ", "")
-
-app_dir = os.path.join(os.path.join(root_dir, "apps"), app)
-work_dir = os.path.join(root_dir, "tasks")
-if not os.path.exists(work_dir):
-    os.mkdir(work_dir)
-auto_docs_dir = os.path.join(app_dir, "auto_docs")
-demo_docs_dir = os.path.join(app_dir, "demo_docs")
-task_timestamp = int(time.time())
-dir_name = datetime.datetime.fromtimestamp(task_timestamp).strftime(f"task_{app}_%Y-%m-%d_%H-%M-%S")
-task_dir = os.path.join(work_dir, dir_name)
-os.mkdir(task_dir)
-log_path = os.path.join(task_dir, f"log_{app}_{dir_name}.txt")
-
-no_doc = False
-if not os.path.exists(auto_docs_dir) and not os.path.exists(demo_docs_dir):
-    print_with_color(f"No documentations found for the app {app}. Do you want to proceed with no docs? Enter y or n",
-                     "red")
-    user_input = ""
-    while user_input != "y" and user_input != "n":
-        user_input = input().lower()
-    if user_input == "y":
-        no_doc = True
-    else:
-        sys.exit()
-elif os.path.exists(auto_docs_dir) and os.path.exists(demo_docs_dir):
-    print_with_color(f"The app {app} has documentations generated from both autonomous exploration and human "
-                     f"demonstration. Which one do you want to use? Type 1 or 2.\n1. Autonomous exploration\n2. Human "
-                     f"Demonstration",
-                     "blue")
-    user_input = ""
-    while user_input != "1" and user_input != "2":
-        user_input = input()
-    if user_input == "1":
-        docs_dir = auto_docs_dir
-    else:
-        docs_dir = demo_docs_dir
-elif os.path.exists(auto_docs_dir):
-    print_with_color(f"Documentations generated from autonomous exploration were found for the app {app}. The doc base "
-                     f"is selected automatically.", "yellow")
-    docs_dir = auto_docs_dir
-else:
-    print_with_color(f"Documentations generated from human demonstration were found for the app {app}. The doc base is "
-                     f"selected automatically.", "yellow")
-    docs_dir = demo_docs_dir
-
-device_list = list_all_devices()
-if not device_list:
-    print_with_color("ERROR: No device found!", "red")
-    sys.exit()
-print_with_color(f"List of devices attached:\n{str(device_list)}", "yellow")
-if len(device_list) == 1:
-    device = device_list[0]
-    print_with_color(f"Device selected: {device}", "yellow")
-else:
-    print_with_color("Please choose the Android device to start demo by entering its ID:", "blue")
-    device = input()
-controller = AndroidController(device)
-width, height = controller.get_device_size()
-if not width and not height:
-    print_with_color("ERROR: Invalid device size!", "red")
-    sys.exit()
-print_with_color(f"Screen resolution of {device}: {width}x{height}", "yellow")
-
-print_with_color("Please enter the description of the task you want me to complete in a few sentences:", "blue")
-task_desc = input()
-
-round_count = 0
-last_act = "None"
-task_complete = False
-grid_on = False
-rows, cols = 0, 0
-
-
-def area_to_xy(area, subarea):
-    area -= 1
-    row, col = area // cols, area % cols
-    x_0, y_0 = col * (width // cols), row * (height // rows)
-    if subarea == "top-left":
-        x, y = x_0 + (width // cols) // 4, y_0 + (height // rows) // 4
-    elif subarea == "top":
-        x, y = x_0 + (width // cols) // 2, y_0 + (height // rows) // 4
-    elif subarea == "top-right":
-        x, y = x_0 + (width // cols) * 3 // 4, y_0 + (height // rows) // 4
-    elif subarea == "left":
-        x, y = x_0 + (width // cols) // 4, y_0 + (height // rows) // 2
-    elif subarea == "right":
-        x, y = x_0 + (width // cols) * 3 // 4, y_0 + (height // rows) // 2
-    elif subarea == "bottom-left":
-        x, y = x_0 + (width // cols) // 4, y_0 + (height // rows) * 3 // 4
-    elif subarea == "bottom":
-        x, y = x_0 + (width // cols) // 2, y_0 + (height // rows) * 3 // 4
-    elif subarea == "bottom-right":
-        x, y = x_0 + (width // cols) * 3 // 4, y_0 + (height // rows) * 3 // 4
-    else:
-        x, y = x_0 + (width // cols) // 2, y_0 + (height // rows) // 2
-    return x, y
-
-
-while round_count < configs["MAX_ROUNDS"]:
-    round_count += 1
-    print_with_color(f"Round {round_count}", "yellow")
-    screenshot_path = controller.get_screenshot(f"{dir_name}_{round_count}", task_dir)
-    xml_path = controller.get_xml(f"{dir_name}_{round_count}", task_dir)
-    if screenshot_path == "ERROR" or xml_path == "ERROR":
-        break
-    if grid_on:
-        rows, cols = draw_grid(screenshot_path, os.path.join(task_dir, f"{dir_name}_{round_count}_grid.png"))
-        image = os.path.join(task_dir, f"{dir_name}_{round_count}_grid.png")
-        prompt = prompts.task_template_grid
-    else:
-        clickable_list = []
-        focusable_list = []
-        traverse_tree(xml_path, clickable_list, "clickable", True)
-        traverse_tree(xml_path, focusable_list, "focusable", True)
-        elem_list = clickable_list.copy()
-        for elem in focusable_list:
-            bbox = elem.bbox
-            center = (bbox[0][0] + bbox[1][0]) // 2, (bbox[0][1] + bbox[1][1]) // 2
-            close = False
-            for e in clickable_list:
-                bbox = e.bbox
-                center_ = (bbox[0][0] + bbox[1][0]) // 2, (bbox[0][1] + bbox[1][1]) // 2
-                dist = (abs(center[0] - center_[0]) ** 2 + abs(center[1] - center_[1]) ** 2) ** 0.5
-                if dist <= configs["MIN_DIST"]:
-                    close = True
-                    break
-            if not close:
-                elem_list.append(elem)
-        draw_bbox_multi(screenshot_path, os.path.join(task_dir, f"{dir_name}_{round_count}_labeled.png"), elem_list,
-                        dark_mode=configs["DARK_MODE"])
-        image = os.path.join(task_dir, f"{dir_name}_{round_count}_labeled.png")
-        if no_doc:
-            prompt = re.sub(r"<ui_document>", "", prompts.task_template)
-        else:
-            ui_doc = ""
-            for i, elem in enumerate(elem_list):
-                doc_path = os.path.join(docs_dir, f"{elem.uid}.txt")
-                if not os.path.exists(doc_path):
-                    continue
-                ui_doc += f"Documentation of UI element labeled with the numeric tag '{i + 1}':\n"
-                doc_content = ast.literal_eval(open(doc_path, "r").read())
-                if doc_content["tap"]:
-                    ui_doc += f"This UI element is clickable. {doc_content['tap']}\n\n"
-                if doc_content["text"]:
-                    ui_doc += f"This UI element can receive text input. The text input is used for the following " \
-                              f"purposes: {doc_content['text']}\n\n"
-                if doc_content["long_press"]:
-                    ui_doc += f"This UI element is long clickable. {doc_content['long_press']}\n\n"
-                if doc_content["v_swipe"]:
-                    ui_doc += f"This element can be swiped directly without tapping. You can swipe vertically on " \
-                              f"this UI element. {doc_content['v_swipe']}\n\n"
-                if doc_content["h_swipe"]:
-                    ui_doc += f"This element can be swiped directly without tapping. You can swipe horizontally on " \
-                              f"this UI element. {doc_content['h_swipe']}\n\n"
-            print_with_color(f"Documentations retrieved for the current interface:\n{ui_doc}", "magenta")
-            ui_doc = """
-            You also have access to the following documentations that describes the functionalities of UI 
-            elements you can interact on the screen. These docs are crucial for you to determine the target of your 
-            next action. You should always prioritize these documented elements for interaction:""" + ui_doc
-            prompt = re.sub(r"<ui_document>", ui_doc, prompts.task_template)
-    prompt = re.sub(r"<task_description>", task_desc, prompt)
-    prompt = re.sub(r"<last_act>", last_act, prompt)
-    print_with_color("Thinking about what to do in the next step...", "yellow")
-    status, rsp = mllm.get_model_response(prompt, [image])
-
-    if status:
-        with open(log_path, "a") as logfile:
-            log_item = {"step": round_count, "prompt": prompt, "image": f"{dir_name}_{round_count}_labeled.png",
-                        "response": rsp}
-            logfile.write(json.dumps(log_item) + "\n")
-        if grid_on:
-            res = parse_grid_rsp(rsp)
-        else:
-            res = parse_explore_rsp(rsp)
-        act_name = res[0]
-        if act_name == "FINISH":
-            task_complete = True
-            break
-        if act_name == "ERROR":
-            break
-        last_act = res[-1]
-        res = res[:-1]
-        if act_name == "tap":
-            _, area = res
-            tl, br = elem_list[area - 1].bbox
-            x, y = (tl[0] + br[0]) // 2, (tl[1] + br[1]) // 2
-            ret = controller.tap(x, y)
-            if ret == "ERROR":
-                print_with_color("ERROR: tap execution failed", "red")
-                break
-        elif act_name == "text":
-            _, input_str = res
-            ret = controller.text(input_str)
-            if ret == "ERROR":
-                print_with_color("ERROR: text execution failed", "red")
-                break
-        elif act_name == "long_press":
-            _, area = res
-            tl, br = elem_list[area - 1].bbox
-            x, y = (tl[0] + br[0]) // 2, (tl[1] + br[1]) // 2
-            ret = controller.long_press(x, y)
-            if ret == "ERROR":
-                print_with_color("ERROR: long press execution failed", "red")
-                break
-        elif act_name == "swipe":
-            _, area, swipe_dir, dist = res
-            tl, br = elem_list[area - 1].bbox
-            x, y = (tl[0] + br[0]) // 2, (tl[1] + br[1]) // 2
-            ret = controller.swipe(x, y, swipe_dir, dist)
-            if ret == "ERROR":
-                print_with_color("ERROR: swipe execution failed", "red")
-                break
-        elif act_name == "grid":
-            grid_on = True
-        elif act_name == "tap_grid" or act_name == "long_press_grid":
-            _, area, subarea = res
-            x, y = area_to_xy(area, subarea)
-            if act_name == "tap_grid":
-                ret = controller.tap(x, y)
-                if ret == "ERROR":
-                    print_with_color("ERROR: tap execution failed", "red")
-                    break
-            else:
-                ret = controller.long_press(x, y)
-                if ret == "ERROR":
-                    print_with_color("ERROR: tap execution failed", "red")
-                    break
-        elif act_name == "swipe_grid":
-            _, start_area, start_subarea, end_area, end_subarea = res
-            start_x, start_y = area_to_xy(start_area, start_subarea)
-            end_x, end_y = area_to_xy(end_area, end_subarea)
-            ret = controller.swipe_precise((start_x, start_y), (end_x, end_y))
-            if ret == "ERROR":
-                print_with_color("ERROR: tap execution failed", "red")
-                break
-        if act_name != "grid":
-            grid_on = False
-        time.sleep(configs["REQUEST_INTERVAL"])
-    else:
-        print_with_color(rsp, "red")
-        break
-
-if task_complete:
-    print_with_color("Task completed successfully", "yellow")
-elif round_count == configs["MAX_ROUNDS"]:
-    print_with_color("Task finished due to reaching max rounds", "yellow")
-else:
-    print_with_color("Task finished unexpectedly", "red")
+import argparse
+import ast
+import asyncio
+import datetime
+import json
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+import prompts
+from config import load_config
+from and_controller import list_all_devices_async, AsyncAndroidController
+from model import parse_explore_act, parse_explore_rsp, parse_grid_act, parse_grid_rsp, OpenAIModel, QwenModel, \
+    ResponseParser
+from observation_cache import ObservationCache, ScreenFingerprint, perceptual_hash
+from rate_limiter import RateLimiter
+from response_cache import CachedModel
+from utils import print_with_color, draw_bbox_multi, draw_grid, ImageEncoder
+
+configs = load_config()
+
+
+def create_model():
+    if configs["MODEL"] == "OpenAI":
+        mllm = OpenAIModel(base_url=configs["OPENAI_API_BASE"],
+                           api_key=configs["OPENAI_API_KEY"],
+                           model=configs["OPENAI_API_MODEL"],
+                           temperature=configs["TEMPERATURE"],
+                           max_tokens=configs["MAX_TOKENS"],
+                           image_encoder=ImageEncoder(configs["IMAGE_FORMAT"], configs["IMAGE_QUALITY"],
+                                                      configs["IMAGE_MAX_EDGE"], configs["IMAGE_MAX_BYTES"]),
+                           pool_size=configs["MODEL_POOL_SIZE"],
+                           connect_timeout=configs["MODEL_CONNECT_TIMEOUT"],
+                           read_timeout=configs["MODEL_READ_TIMEOUT"],
+                           max_retries=configs["MODEL_MAX_RETRIES"],
+                           retry_backoff=configs["MODEL_RETRY_BACKOFF"],
+                           rate_limiter=RateLimiter.for_key(configs["OPENAI_API_KEY"], configs["OPENAI_API_BASE"]),
+                           stream=configs["MODEL_STREAM"])
+    elif configs["MODEL"] == "Qwen":
+        mllm = QwenModel(api_key=configs["DASHSCOPE_API_KEY"],
+                         model=configs["QWEN_MODEL"],
+                         max_retries=configs["MODEL_MAX_RETRIES"],
+                         retry_backoff=configs["MODEL_RETRY_BACKOFF"],
+                         rate_limiter=RateLimiter.for_key(configs["DASHSCOPE_API_KEY"], "dashscope"))
+    else:
+        print_with_color(f"ERROR: Unsupported model type {configs['MODEL']}!", "red")
+        return None
+    if configs["MODEL_CACHE"] != "off":
+        mllm = CachedModel(mllm, mode=configs["MODEL_CACHE"])
+    return mllm
+
+
+def get_image_path(task_dir, name):
+    # None keeps the image in memory only, the model receives it from memory either way
+    return os.path.join(task_dir, name) if configs["SAVE_IMAGES"] else None
+
+
+async def label_screenshot(observation_cache, table, screenshot, labeled_path, excluded=()):
+    # the element list and labeled screenshot of a screen that was seen before are taken from the cache instead of
+    # being derived again
+    fingerprint = ScreenFingerprint(table.structure_hash, await asyncio.to_thread(perceptual_hash, screenshot),
+                                    table.content_hash)
+    variant = frozenset(excluded)
+    cached = observation_cache.get(fingerprint, variant)
+    if cached is not None:
+        elem_list, labeled = cached
+        labeled = labeled.copy()
+        if labeled_path:
+            labeled.save(labeled_path)
+        return elem_list, labeled
+    elem_list = table.get_elem_list(excluded)
+    labeled = await asyncio.to_thread(draw_bbox_multi, screenshot, labeled_path, elem_list,
+                                      dark_mode=configs["DARK_MODE"])
+    observation_cache.put(fingerprint, (elem_list, labeled), variant)
+    return elem_list, labeled
+
+
+SUBAREAS = {"top-left": 0, "top": 1, "top-right": 2, "left": 3, "center": 4, "right": 5, "bottom-left": 6, "bottom": 7,
+            "bottom-right": 8}
+grid_points = {}
+
+
+def get_grid_points(width, height, rows, cols):
+    # the tap position of every subarea of every grid area, computed once per screen size and grid layout
+    key = width, height, rows, cols
+    if key not in grid_points:
+        unit_width, unit_height = width // cols, height // rows
+        offsets_x = np.array([unit_width // 4, unit_width // 2, unit_width * 3 // 4] * 3)
+        offsets_y = np.repeat([unit_height // 4, unit_height // 2, unit_height * 3 // 4], 3)
+        row, col = np.divmod(np.arange(rows * cols), cols)
+        points = np.empty((rows * cols, len(SUBAREAS), 2), dtype=np.int64)
+        points[:, :, 0] = (col * unit_width)[:, None] + offsets_x
+        points[:, :, 1] = (row * unit_height)[:, None] + offsets_y
+        grid_points[key] = points.tolist()
+    return grid_points[key]
+
+
+def area_to_xy(area, subarea, width, height, rows, cols):
+    points = get_grid_points(width, height, rows, cols)
+    if not 1 <= area <= len(points):
+        print_with_color(f"ERROR: Grid area {area} does not exist, the grid has {len(points)} areas", "red")
+        return None
+    # any other subarea name falls back to the center of the area
+    return tuple(points[area - 1][SUBAREAS.get(subarea, SUBAREAS["center"])])
+
+
+async def execute_action(controller, res, elem_list, width, height, rows, cols):
+    # performs a parsed action on the device, grid areas are resolved with the grid of the labeled image
+    act_name = res[0]
+    if act_name == "tap":
+        _, area = res
+        x, y = elem_list[area - 1].center
+        ret = await controller.tap(x, y)
+        if ret == "ERROR":
+            print_with_color("ERROR: tap execution failed", "red")
+        return ret
+    elif act_name == "text":
+        _, input_str = res
+        ret = await controller.text(input_str)
+        if ret == "ERROR":
+            print_with_color("ERROR: text execution failed", "red")
+        return ret
+    elif act_name == "long_press":
+        _, area = res
+        x, y = elem_list[area - 1].center
+        ret = await controller.long_press(x, y)
+        if ret == "ERROR":
+            print_with_color("ERROR: long press execution failed", "red")
+        return ret
+    elif act_name == "swipe":
+        _, area, swipe_dir, dist = res
+        x, y = elem_list[area - 1].center
+        ret = await controller.swipe(x, y, swipe_dir, dist)
+        if ret == "ERROR":
+            print_with_color("ERROR: swipe execution failed", "red")
+        return ret
+    elif act_name == "tap_grid" or act_name == "long_press_grid":
+        _, area, subarea = res
+        point = area_to_xy(area, subarea, width, height, rows, cols)
+        if point is None:
+            return "ERROR"
+        x, y = point
+        if act_name == "tap_grid":
+            ret = await controller.tap(x, y)
+            if ret == "ERROR":
+                print_with_color("ERROR: tap execution failed", "red")
+        else:
+            ret = await controller.long_press(x, y)
+            if ret == "ERROR":
+                print_with_color("ERROR: long press execution failed", "red")
+        return ret
+    elif act_name == "swipe_grid":
+        _, start_area, start_subarea, end_area, end_subarea = res
+        start = area_to_xy(start_area, start_subarea, width, height, rows, cols)
+        end = area_to_xy(end_area, end_subarea, width, height, rows, cols)
+        if start is None or end is None:
+            return "ERROR"
+        ret = await controller.swipe_precise(start, end)
+        if ret == "ERROR":
+            print_with_color("ERROR: swipe execution failed", "red")
+        return ret
+    return "ERROR"
+
+
+async def request_action(mllm, prompt, images, parse_act, execute):
+    # asks the model for the next action. When the response is streamed, execute(res) starts as soon as the Action
+    # line is complete, so the device acts while the model is still writing the summary. Returns the status and the
+    # complete response together with the task running the action, which is None if it was not started early
+    start = time.time()
+    parser = ResponseParser()
+    action_task = None
+
+    def on_text(text):
+        nonlocal action_task
+        if action_task is not None:
+            return
+        act = parser.feed(text).get("Action")
+        if act is None:
+            return
+        try:
+            res = parse_act(act)
+        except Exception:
+            # a malformed action is reported by the parsing of the complete response
+            return
+        if res[0] in ("FINISH", "grid", "ERROR"):
+            return
+        print_with_color(f"Time to action: {time.time() - start:.2f}s, starting {act}", "yellow")
+        action_task = asyncio.create_task(execute(res))
+
+    status, rsp = await mllm.get_model_response_async(prompt, images, on_text)
+    print_with_color(f"Response time: {time.time() - start:.2f}s", "yellow")
+    return status, rsp, action_task
+
+
+async def run_task(controller, mllm, task_desc, task_dir, dir_name, log_path, docs_dir=None):
+    # runs one task on one device, docs_dir is None when the task proceeds without documentations
+    width, height = controller.width, controller.height
+    round_count = 0
+    last_act = "None"
+    task_complete = False
+    grid_on = False
+    rows, cols = 0, 0
+    observation_cache = ObservationCache()
+    while round_count < configs["MAX_ROUNDS"]:
+        round_count += 1
+        print_with_color(f"Round {round_count}", "yellow")
+        observation = await controller.capture_observation(f"{dir_name}_{round_count}", task_dir,
+                                                           save_screenshot=configs["SAVE_IMAGES"])
+        screenshot = observation.screenshot
+        if screenshot is None or observation.table is None:
+            break
+        if grid_on:
+            image, rows, cols = await asyncio.to_thread(draw_grid, screenshot,
+                                                        get_image_path(task_dir, f"{dir_name}_{round_count}_grid.png"),
+                                                        configs["GRID_TEMPLATE_DIR"])
+            prompt = prompts.task_template_grid
+        else:
+            elem_list, image = await label_screenshot(
+                observation_cache, observation.table, screenshot,
+                get_image_path(task_dir, f"{dir_name}_{round_count}_labeled.png"))
+            if docs_dir is None:
+                prompt = re.sub(r"<ui_document>", "", prompts.task_template)
+            else:
+                ui_doc = ""
+                for i, elem in enumerate(elem_list):
+                    doc_path = os.path.join(docs_dir, f"{elem.uid}.txt")
+                    if not os.path.exists(doc_path):
+                        continue
+                    ui_doc += f"Documentation of UI element labeled with the numeric tag '{i + 1}':\n"
+                    doc_content = ast.literal_eval(open(doc_path, "r").read())
+                    if doc_content["tap"]:
+                        ui_doc += f"This UI element is clickable. {doc_content['tap']}\n\n"
+                    if doc_content["text"]:
+                        ui_doc += f"This UI element can receive text input. The text input is used for the following " \
+                                  f"purposes: {doc_content['text']}\n\n"
+                    if doc_content["long_press"]:
+                        ui_doc += f"This UI element is long clickable. {doc_content['long_press']}\n\n"
+                    if doc_content["v_swipe"]:
+                        ui_doc += f"This element can be swiped directly without tapping. You can swipe vertically on " \
+                                  f"this UI element. {doc_content['v_swipe']}\n\n"
+                    if doc_content["h_swipe"]:
+                        ui_doc += f"This element can be swiped directly without tapping. You can swipe horizontally " \
+                                  f"on this UI element. {doc_content['h_swipe']}\n\n"
+                print_with_color(f"Documentations retrieved for the current interface:\n{ui_doc}", "magenta")
+                ui_doc = """
+                You also have access to the following documentations that describes the functionalities of UI 
+                elements you can interact on the screen. These docs are crucial for you to determine the target of your
+                next action. You should always prioritize these documented elements for interaction:""" + ui_doc
+                prompt = re.sub(r"<ui_document>", ui_doc, prompts.task_template)
+        prompt = re.sub(r"<task_description>", task_desc, prompt)
+        prompt = re.sub(r"<last_act>", last_act, prompt)
+        print_with_color("Thinking about what to do in the next step...", "yellow")
+        status, rsp, action_task = await request_action(
+            mllm, prompt, [image], parse_grid_act if grid_on else parse_explore_act,
+            lambda res: execute_action(controller, res, elem_list, width, height, rows, cols))
+
+        if status:
+            with open(log_path, "a") as logfile:
+                log_item = {"step": round_count, "prompt": prompt, "image": f"{dir_name}_{round_count}_labeled.png",
+                            "response": rsp}
+                logfile.write(json.dumps(log_item) + "\n")
+            if grid_on:
+                res = parse_grid_rsp(rsp)
+            else:
+                res = parse_explore_rsp(rsp)
+            # an action started from the streamed Action line is the same one the complete response parses to
+            ret = await action_task if action_task is not None else None
+            act_name = res[0]
+            if act_name == "FINISH":
+                task_complete = True
+                break
+            if act_name == "ERROR":
+                break
+            last_act = res[-1]
+            res = res[:-1]
+            if action_task is None and act_name != "grid":
+                ret = await execute_action(controller, res, elem_list, width, height, rows, cols)
+            if ret == "ERROR":
+                break
+            if act_name == "grid":
+                grid_on = True
+            else:
+                grid_on = False
+                await controller.wait_for_settle()
+        else:
+            if action_task is not None:
+                await action_task
+            print_with_color(rsp, "red")
+            break
+    print_with_color(f"Observation cache: {observation_cache.stats()}", "yellow")
+    return task_complete, round_count
+
+
+async def main():
+    arg_desc = "AppAgent Executor"
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, description=arg_desc)
+    parser.add_argument("--app")
+    parser.add_argument("--root_dir", default="./")
+    args = vars(parser.parse_args())
+
+    mllm = create_model()
+    if mllm is None:
+        sys.exit()
+
+    app = args["app"]
+    root_dir = args["root_dir"]
+
+    if not app:
+        print_with_color("What is the name of the app you want me to operate?", "blue")
+        app = input()
+        app = app.replace(" ", "")
+
+    app_dir = os.path.join(os.path.join(root_dir, "apps"), app)
+    work_dir = os.path.join(root_dir, "tasks")
+    if not os.path.exists(work_dir):
+        os.mkdir(work_dir)
+    auto_docs_dir = os.path.join(app_dir, "auto_docs")
+    demo_docs_dir = os.path.join(app_dir, "demo_docs")
+    task_timestamp = int(time.time())
+    dir_name = datetime.datetime.fromtimestamp(task_timestamp).strftime(f"task_{app}_%Y-%m-%d_%H-%M-%S")
+    task_dir = os.path.join(work_dir, dir_name)
+    os.mkdir(task_dir)
+    log_path = os.path.join(task_dir, f"log_{app}_{dir_name}.txt")
+
+    docs_dir = None
+    if not os.path.exists(auto_docs_dir) and not os.path.exists(demo_docs_dir):
+        print_with_color(f"No documentations found for the app {app}. Do you want to proceed with no docs? Enter y or "
+                         f"n", "red")
+        user_input = ""
+        while user_input != "y" and user_input != "n":
+            user_input = input().lower()
+        if user_input != "y":
+            sys.exit()
+    elif os.path.exists(auto_docs_dir) and os.path.exists(demo_docs_dir):
+        print_with_color(f"The app {app} has documentations generated from both autonomous exploration and human "
+                         f"demonstration. Which one do you want to use? Type 1 or 2.\n1. Autonomous exploration\n2. "
+                         f"Human Demonstration",
+                         "blue")
+        user_input = ""
+        while user_input != "1" and user_input != "2":
+            user_input = input()
+        if user_input == "1":
+            docs_dir = auto_docs_dir
+        else:
+            docs_dir = demo_docs_dir
+    elif os.path.exists(auto_docs_dir):
+        print_with_color(f"Documentations generated from autonomous exploration were found for the app {app}. The doc "
+                         f"base is selected automatically.", "yellow")
+        docs_dir = auto_docs_dir
+    else:
+        print_with_color(f"Documentations generated from human demonstration were found for the app {app}. The doc "
+                         f"base is selected automatically.", "yellow")
+        docs_dir = demo_docs_dir
+
+    device_list = await list_all_devices_async()
+    if not device_list:
+        print_with_color("ERROR: No device found!", "red")
+        sys.exit()
+    print_with_color(f"List of devices attached:\n{str(device_list)}", "yellow")
+    if len(device_list) == 1:
+        device = device_list[0]
+        print_with_color(f"Device selected: {device}", "yellow")
+    else:
+        print_with_color("Please choose the Android device to start demo by entering its ID:", "blue")
+        device = input()
+    controller = await AsyncAndroidController.create(device)
+    width, height = controller.width, controller.height
+    if not width and not height:
+        print_with_color("ERROR: Invalid device size!", "red")
+        sys.exit()
+    print_with_color(f"Screen resolution of {device}: {width}x{height}", "yellow")
+
+    print_with_color("Please enter the description of the task you want me to complete in a few sentences:", "blue")
+    task_desc = input()
+
+    task_complete, round_count = await run_task(controller, mllm, task_desc, task_dir, dir_name, log_path, docs_dir)
+    await controller.close()
+    await mllm.close_async()
+    print_with_color(f"Model connections: {mllm.get_stats()}", "yellow")
+
+    if task_complete:
+        print_with_color("Task completed successfully", "yellow")
+    elif round_count == configs["MAX_ROUNDS"]:
+        print_with_color("Task finished due to reaching max rounds", "yellow")
+    else:
+        print_with_color("Task finished unexpectedly", "red")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
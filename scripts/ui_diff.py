@@ -0,0 +1,74 @@
+import numpy as np
+
+
+class UIDiff:
+    # the changes between the element tables of two consecutive screens, added and removed hold rows of the new and
+    # the old table, moved and changed hold (old row, new row) pairs of the same element
+    def __init__(self, old_table, new_table, added, removed, moved, changed):
+        self.old_table = old_table
+        self.new_table = new_table
+        self.added = added
+        self.removed = removed
+        self.moved = moved
+        self.changed = changed
+
+    def is_empty(self):
+        return not (self.added or self.removed or self.moved or self.changed)
+
+    def get_changed_region(self):
+        # the smallest box covering every changed element at both its old and new position, None if nothing changed
+        old_rows = self.removed + [old for old, _ in self.moved + self.changed]
+        new_rows = self.added + [new for _, new in self.moved + self.changed]
+        if not old_rows and not new_rows:
+            return None
+        boxes = [np.stack([table.x1[rows], table.y1[rows], table.x2[rows], table.y2[rows]], axis=1)
+                 for table, rows in ((self.old_table, old_rows), (self.new_table, new_rows)) if rows]
+        boxes = np.concatenate(boxes)
+        return (int(boxes[:, 0].min()), int(boxes[:, 1].min())), (int(boxes[:, 2].max()), int(boxes[:, 3].max()))
+
+    def summary(self):
+        return {"added": [self.new_table.get_uid(row) for row in self.added],
+                "removed": [self.old_table.get_uid(row) for row in self.removed],
+                "moved": [self.new_table.get_uid(new) for _, new in self.moved],
+                "changed": [self.new_table.get_uid(new) for _, new in self.changed],
+                "region": self.get_changed_region()}
+
+    def __str__(self):
+        if self.is_empty():
+            return "no changes"
+        return f"{len(self.added)} added, {len(self.removed)} removed, {len(self.moved)} moved, " \
+               f"{len(self.changed)} changed in {self.get_changed_region()}"
+
+
+def get_element_keys(table):
+    # an element is identified by its uid, which includes its parent and index, plus how often that uid occurred
+    # before it so repeated list items stay apart
+    seen = {}
+    keys = {}
+    for row in range(len(table)):
+        uid = table.get_uid(row)
+        occurrence = seen.get(uid, 0)
+        seen[uid] = occurrence + 1
+        keys[(uid, occurrence)] = row
+    return keys
+
+
+def diff_ui(old_table, new_table):
+    # one hash lookup per element, so the cost is linear in the size of the two screens
+    if old_table.structure_hash is not None and old_table.structure_hash == new_table.structure_hash \
+            and old_table.texts == new_table.texts:
+        return UIDiff(old_table, new_table, [], [], [], [])
+    old_keys = get_element_keys(old_table)
+    added, moved, changed = [], [], []
+    for key, new in get_element_keys(new_table).items():
+        old = old_keys.pop(key, None)
+        if old is None:
+            added.append(new)
+            continue
+        if (old_table.x1[old], old_table.y1[old], old_table.x2[old], old_table.y2[old]) != \
+                (new_table.x1[new], new_table.y1[new], new_table.x2[new], new_table.y2[new]):
+            moved.append((old, new))
+        if old_table.flags[old] != new_table.flags[new] or old_table.states[old] != new_table.states[new] \
+                or old_table.texts[old] != new_table.texts[new]:
+            changed.append((old, new))
+    return UIDiff(old_table, new_table, added, sorted(old_keys.values()), moved, changed)
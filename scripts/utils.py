@@ -1,100 +1,429 @@
-import base64
-import cv2
-import pyshine as ps
-
-from colorama import Fore, Style
-
-
-def print_with_color(text: str, color=""):
-    if color == "red":
-        print(Fore.RED + text)
-    elif color == "green":
-        print(Fore.GREEN + text)
-    elif color == "yellow":
-        print(Fore.YELLOW + text)
-    elif color == "blue":
-        print(Fore.BLUE + text)
-    elif color == "magenta":
-        print(Fore.MAGENTA + text)
-    elif color == "cyan":
-        print(Fore.CYAN + text)
-    elif color == "white":
-        print(Fore.WHITE + text)
-    elif color == "black":
-        print(Fore.BLACK + text)
-    else:
-        print(text)
-    print(Style.RESET_ALL)
-
-
-def draw_bbox_multi(img_path, output_path, elem_list, record_mode=False, dark_mode=False):
-    imgcv = cv2.imread(img_path)
-    count = 1
-    for elem in elem_list:
-        try:
-            top_left = elem.bbox[0]
-            bottom_right = elem.bbox[1]
-            left, top = top_left[0], top_left[1]
-            right, bottom = bottom_right[0], bottom_right[1]
-            label = str(count)
-            if record_mode:
-                if elem.attrib == "clickable":
-                    color = (250, 0, 0)
-                elif elem.attrib == "focusable":
-                    color = (0, 0, 250)
-                else:
-                    color = (0, 250, 0)
-                imgcv = ps.putBText(imgcv, label, text_offset_x=(left + right) // 2 + 10, text_offset_y=(top + bottom) // 2 + 10,
-                                    vspace=10, hspace=10, font_scale=1, thickness=2, background_RGB=color,
-                                    text_RGB=(255, 250, 250), alpha=0.5)
-            else:
-                text_color = (10, 10, 10) if dark_mode else (255, 250, 250)
-                bg_color = (255, 250, 250) if dark_mode else (10, 10, 10)
-                imgcv = ps.putBText(imgcv, label, text_offset_x=(left + right) // 2 + 10, text_offset_y=(top + bottom) // 2 + 10,
-                                    vspace=10, hspace=10, font_scale=1, thickness=2, background_RGB=bg_color,
-                                    text_RGB=text_color, alpha=0.5)
-        except Exception as e:
-            print_with_color(f"ERROR: An exception occurs while labeling the image\n{e}", "red")
-        count += 1
-    cv2.imwrite(output_path, imgcv)
-    return imgcv
-
-
-def draw_grid(img_path, output_path):
-    def get_unit_len(n):
-        for i in range(1, n + 1):
-            if n % i == 0 and 120 <= i <= 180:
-                return i
-        return -1
-
-    image = cv2.imread(img_path)
-    height, width, _ = image.shape
-    color = (255, 116, 113)
-    unit_height = get_unit_len(height)
-    if unit_height < 0:
-        unit_height = 120
-    unit_width = get_unit_len(width)
-    if unit_width < 0:
-        unit_width = 120
-    thick = int(unit_width // 50)
-    rows = height // unit_height
-    cols = width // unit_width
-    for i in range(rows):
-        for j in range(cols):
-            label = i * cols + j + 1
-            left = int(j * unit_width)
-            top = int(i * unit_height)
-            right = int((j + 1) * unit_width)
-            bottom = int((i + 1) * unit_height)
-            cv2.rectangle(image, (left, top), (right, bottom), color, thick // 2)
-            cv2.putText(image, str(label), (left + int(unit_width * 0.05) + 3, top + int(unit_height * 0.3) + 3), 0,
-                        int(0.01 * unit_width), (0, 0, 0), thick)
-            cv2.putText(image, str(label), (left + int(unit_width * 0.05), top + int(unit_height * 0.3)), 0,
-                        int(0.01 * unit_width), color, thick)
-    cv2.imwrite(output_path, image)
-    return rows, cols
-
-
-def encode_image(image_path):
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+import asyncio
+import base64
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from colorama import Fore, Style
+
+
+def print_with_color(text: str, color=""):
+    if color == "red":
+        print(Fore.RED + text)
+    elif color == "green":
+        print(Fore.GREEN + text)
+    elif color == "yellow":
+        print(Fore.YELLOW + text)
+    elif color == "blue":
+        print(Fore.BLUE + text)
+    elif color == "magenta":
+        print(Fore.MAGENTA + text)
+    elif color == "cyan":
+        print(Fore.CYAN + text)
+    elif color == "white":
+        print(Fore.WHITE + text)
+    elif color == "black":
+        print(Fore.BLACK + text)
+    else:
+        print(text)
+    print(Style.RESET_ALL)
+
+
+background_loop = None
+background_loop_lock = threading.Lock()
+
+
+def get_background_loop():
+    global background_loop
+    with background_loop_lock:
+        if background_loop is None:
+            background_loop = asyncio.new_event_loop()
+            threading.Thread(target=background_loop.run_forever, name="appagent_loop", daemon=True).start()
+    return background_loop
+
+
+def run_sync(coro):
+    # the synchronous APIs are thin wrappers that run the async implementation on one shared background event loop
+    return asyncio.run_coroutine_threadsafe(coro, get_background_loop()).result()
+
+
+artifact_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="artifact_writer")
+
+
+def _write_file(path, data):
+    try:
+        with open(path, "wb") as f:
+            f.write(data)
+    except OSError as e:
+        print_with_color(f"ERROR: Failed to save {path}: {e}", "red")
+
+
+def save_file_async(path, data):
+    # writes happen in order on a single background thread, pending writes are flushed before the interpreter exits
+    return artifact_writer.submit(_write_file, path, data)
+
+
+class MemoryImage:
+    # an image on its way from the device to the model payload. It holds the decoded BGR frame and the encoded PNG
+    # bytes, each one produced from the other on first use, and caches the base64 form of the bytes, so a screenshot
+    # is decoded, labeled and encoded once without a round trip through the disk. Saving it is a background write
+    def __init__(self, frame=None, data=None, path=None):
+        self.frame = frame
+        self.data = data
+        self.path = path
+        self.base64 = None
+        self.thumbnail = None
+        self.saved = None
+        self.encoded = {}
+        self.digest = None
+
+    @classmethod
+    def from_file(cls, path):
+        image = cls(path=path)
+        image.saved = Future()
+        image.saved.set_result(None)
+        return image
+
+    def get_bytes(self):
+        if self.data is None:
+            if self.frame is not None:
+                self.data = cv2.imencode(".png", self.frame)[1].tobytes()
+            elif self.path is not None:
+                with open(self.path, "rb") as f:
+                    self.data = f.read()
+        return self.data
+
+    def get_frame(self):
+        if self.frame is None and self.get_bytes() is not None:
+            self.frame = cv2.imdecode(np.frombuffer(self.data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        return self.frame
+
+    def get_digest(self):
+        # content hash of the image, taken over the pixels when they are decoded and over the encoded bytes otherwise
+        if self.digest is None:
+            if self.frame is not None:
+                content = np.ascontiguousarray(self.frame)
+                digest = hashlib.blake2b(str(content.shape).encode(), digest_size=16)
+                digest.update(content.data)
+                self.digest = digest.hexdigest()
+            else:
+                self.digest = hashlib.blake2b(self.get_bytes(), digest_size=16).hexdigest()
+        return self.digest
+
+    def get_size(self):
+        # PNG bytes carry the size in their header, so it is known without decoding the image
+        if self.frame is None and self.get_bytes()[:8] == b"\x89PNG\r\n\x1a\n":
+            return struct.unpack(">II", self.data[16:24])
+        height, width = self.get_frame().shape[:2]
+        return width, height
+
+    def get_base64(self):
+        if self.base64 is None:
+            self.base64 = base64.b64encode(self.get_bytes()).decode("utf-8")
+        return self.base64
+
+    def get_encoded(self, encoder):
+        # the upload form of the image for the settings of encoder, it is only computed once per image and encoder
+        if encoder.key not in self.encoded:
+            self.encoded[encoder.key] = encoder.encode(self)
+        return self.encoded[encoder.key]
+
+    def get_thumbnail(self):
+        # grayscale at a quarter of the size, PNG bytes are decoded straight to it without building the full frame
+        if self.thumbnail is None:
+            if self.data is not None or self.frame is None:
+                self.thumbnail = cv2.imdecode(np.frombuffer(self.get_bytes(), dtype=np.uint8),
+                                              cv2.IMREAD_REDUCED_GRAYSCALE_4)
+            else:
+                height, width = self.frame.shape[:2]
+                self.thumbnail = cv2.resize(cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY), (width // 4, height // 4),
+                                            interpolation=cv2.INTER_AREA)
+        return self.thumbnail
+
+    def copy(self):
+        # shares the frame and the encoded forms, e.g. to save a cached labeled screenshot under a new name
+        image = MemoryImage(self.frame, self.data)
+        image.base64 = self.base64
+        image.thumbnail = self.thumbnail
+        image.encoded = self.encoded
+        image.digest = self.digest
+        return image
+
+    def save(self, path):
+        self.path = path
+        self.saved = save_file_async(path, self.get_bytes())
+        return self.saved
+
+    def get_path(self):
+        # for model APIs that only read files, returns the path and whether it is a temporary file. An image that was
+        # never saved is written to a new temporary file on every call, which the caller deletes once it is done
+        if self.saved is None:
+            fd, path = tempfile.mkstemp(suffix=".png")
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.get_bytes())
+            return path, True
+        self.saved.result()
+        return self.path, False
+
+
+class EncodedImage:
+    def __init__(self, data, mime_type, size, original_size, quality):
+        self.data = data
+        self.mime_type = mime_type
+        self.size = size
+        self.original_size = original_size
+        self.quality = quality
+        self.base64 = base64.b64encode(data).decode("utf-8")
+
+    def get_data_url(self):
+        return f"data:{self.mime_type};base64,{self.base64}"
+
+    def __str__(self):
+        width, height = self.size
+        original_width, original_height = self.original_size
+        resized = f"{original_width}x{original_height} -> " if self.size != self.original_size else ""
+        return f"{resized}{width}x{height} {self.mime_type.split('/')[1]} {len(self.data) / 1024:.1f} KB"
+
+
+class ImageEncoder:
+    # turns an image into what is uploaded to the model: image_format is png, jpeg or webp, quality applies to jpeg and
+    # webp, max_edge caps the longer side in pixels and max_bytes is a budget the encoder tries to meet by lowering
+    # the quality down to MIN_QUALITY and then shrinking the image down to MIN_EDGE. The tags are drawn before the
+    # image is scaled, so they stay on the elements they label. 0 turns max_edge and max_bytes off
+    FORMATS = {
+        "png": (".png", "image/png", cv2.IMWRITE_PNG_COMPRESSION),
+        "jpeg": (".jpg", "image/jpeg", cv2.IMWRITE_JPEG_QUALITY),
+        "webp": (".webp", "image/webp", cv2.IMWRITE_WEBP_QUALITY),
+    }
+    MIN_QUALITY = 40
+    MIN_EDGE = 768
+
+    def __init__(self, image_format="png", quality=90, max_edge=0, max_bytes=0):
+        if image_format not in self.FORMATS:
+            raise ValueError(f"Unsupported image format {image_format}, must be one of {', '.join(self.FORMATS)}")
+        self.format = image_format
+        self.quality = quality
+        self.max_edge = max_edge
+        self.max_bytes = max_bytes
+        self.key = image_format, quality, max_edge, max_bytes
+
+    def encode_frame(self, frame, quality):
+        extension, _, quality_flag = self.FORMATS[self.format]
+        params = [quality_flag, 1] if self.format == "png" else [quality_flag, quality]
+        return cv2.imencode(extension, frame, params)[1].tobytes()
+
+    def encode(self, image):
+        mime_type = self.FORMATS[self.format][1]
+        if self.format == "png" and not self.max_edge and not self.max_bytes:
+            return EncodedImage(image.get_bytes(), mime_type, image.get_size(), image.get_size(), None)
+        frame = image.get_frame()
+        height, width = frame.shape[:2]
+        scale = min(1, self.max_edge / max(width, height)) if self.max_edge else 1
+        quality = self.quality
+        while True:
+            size = max(1, round(width * scale)), max(1, round(height * scale))
+            resized = frame if size == (width, height) else cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            data = self.encode_frame(resized, quality)
+            if not self.max_bytes or len(data) <= self.max_bytes:
+                break
+            if self.format != "png" and quality > self.MIN_QUALITY:
+                quality = max(self.MIN_QUALITY, quality - 10)
+            elif max(size) * 0.8 >= self.MIN_EDGE:
+                scale *= 0.8
+            else:
+                print_with_color(f"The image could not be encoded within {self.max_bytes} bytes, {len(data)} bytes "
+                                 f"are sent", "yellow")
+                break
+        return EncodedImage(data, mime_type, size, (width, height), None if self.format == "png" else quality)
+
+
+def load_image(img):
+    # accepts a file path, a MemoryImage or a frame returned by AndroidController.get_screenshot_frame, raw RGBA frames
+    # are read-only views over the screencap buffer so a new BGR image is always returned for drawing
+    if isinstance(img, str):
+        return cv2.imread(img)
+    if isinstance(img, MemoryImage):
+        return img.get_frame().copy()
+    if img.ndim == 3 and img.shape[2] == 4:
+        return cv2.cvtColor(img, cv2.COLOR_RGBA2BGR)
+    return img.copy()
+
+
+class LabelRenderer:
+    # draws text on a half transparent box with the same result as pyshine.putBText, which rebuilds a solid box of the
+    # background colour with np.ones, split and merge for every label. The text sizes and the solid boxes are cached per
+    # text and per box shape and colour, so a label costs one blend of its own small region and one cv2.putText call
+    def __init__(self, font=cv2.FONT_HERSHEY_DUPLEX, font_scale=1, thickness=2, vspace=10, hspace=10, alpha=0.5):
+        self.font = font
+        self.font_scale = font_scale
+        self.thickness = thickness
+        self.vspace = vspace
+        self.hspace = hspace
+        self.alpha = alpha
+        self.sizes = {}
+        self.boxes = {}
+
+    def get_text_size(self, text):
+        if text not in self.sizes:
+            self.sizes[text] = cv2.getTextSize(text, self.font, fontScale=self.font_scale, thickness=self.thickness)[0]
+        return self.sizes[text]
+
+    def get_box(self, shape, background_rgb):
+        key = shape, background_rgb
+        if key not in self.boxes:
+            self.boxes[key] = np.full(shape, background_rgb[::-1], dtype=np.uint8)
+        return self.boxes[key]
+
+    def draw(self, img, text, x, y, background_rgb, text_rgb):
+        w, h = self.get_text_size(text)
+        crop = img[y - self.vspace:y + h + self.vspace, x - self.hspace:x + w + self.hspace]
+        if crop.size == 0:
+            raise ValueError(f"The label {text} at ({x}, {y}) is outside of the image")
+        cv2.addWeighted(crop, self.alpha, self.get_box(crop.shape, background_rgb), 1 - self.alpha, 0, dst=crop)
+        cv2.putText(img, text, (x, y + h), self.font, fontScale=self.font_scale, color=text_rgb[::-1],
+                    thickness=self.thickness)
+        return img
+
+
+label_renderer = LabelRenderer()
+
+
+def draw_bbox_multi(img, output_path, elem_list, record_mode=False, dark_mode=False):
+    imgcv = load_image(img)
+    count = 1
+    for elem in elem_list:
+        try:
+            center_x, center_y = elem.center
+            label = str(count)
+            if record_mode:
+                if elem.attrib == "clickable":
+                    color = (250, 0, 0)
+                elif elem.attrib == "focusable":
+                    color = (0, 0, 250)
+                else:
+                    color = (0, 250, 0)
+                imgcv = label_renderer.draw(imgcv, label, center_x + 10, center_y + 10, color, (255, 250, 250))
+            else:
+                text_color = (10, 10, 10) if dark_mode else (255, 250, 250)
+                bg_color = (255, 250, 250) if dark_mode else (10, 10, 10)
+                imgcv = label_renderer.draw(imgcv, label, center_x + 10, center_y + 10, bg_color, text_color)
+        except Exception as e:
+            print_with_color(f"ERROR: An exception occurs while labeling the image\n{e}", "red")
+        count += 1
+    labeled = MemoryImage(imgcv)
+    if output_path:
+        labeled.save(output_path)
+    return labeled
+
+
+def get_unit_len(n):
+    for i in range(120, min(n, 180) + 1):
+        if n % i == 0:
+            return i
+    return -1
+
+
+class GridTemplate:
+    # the grid overlay of one resolution as a BGRA image. It is drawn once over a black and over a white canvas, the
+    # difference of the two gives the coverage of every pixel including the anti-aliased edges of the labels, so
+    # putting the grid on a screenshot is a single blend of the pixels it covers
+    def __init__(self, width, height, overlay=None):
+        self.width = width
+        self.height = height
+        self.unit_height = get_unit_len(height)
+        if self.unit_height < 0:
+            self.unit_height = 120
+        self.unit_width = get_unit_len(width)
+        if self.unit_width < 0:
+            self.unit_width = 120
+        self.rows = height // self.unit_height
+        self.cols = width // self.unit_width
+        self.overlay = self.render() if overlay is None else overlay
+        # flat indices of the covered channel values, the blend is done in 16-bit integers with the colour already
+        # multiplied by its coverage
+        alpha = self.overlay[:, :, 3].reshape(-1)
+        covered = np.flatnonzero(alpha)
+        self.indices = (covered[:, None] * 3 + np.arange(3)).reshape(-1)
+        alpha = np.repeat(alpha[covered], 3).astype(np.uint16)
+        self.inverse_alpha = 255 - alpha
+        self.color = self.overlay[:, :, :3].reshape(-1)[self.indices] * alpha + 127
+
+    def draw(self, image):
+        color = (255, 116, 113)
+        unit_width, unit_height = self.unit_width, self.unit_height
+        thick = int(unit_width // 50)
+        for i in range(self.rows):
+            for j in range(self.cols):
+                label = i * self.cols + j + 1
+                left = int(j * unit_width)
+                top = int(i * unit_height)
+                right = int((j + 1) * unit_width)
+                bottom = int((i + 1) * unit_height)
+                cv2.rectangle(image, (left, top), (right, bottom), color, thick // 2)
+                cv2.putText(image, str(label), (left + int(unit_width * 0.05) + 3, top + int(unit_height * 0.3) + 3),
+                            0, int(0.01 * unit_width), (0, 0, 0), thick)
+                cv2.putText(image, str(label), (left + int(unit_width * 0.05), top + int(unit_height * 0.3)), 0,
+                            int(0.01 * unit_width), color, thick)
+        return image
+
+    def render(self):
+        black = self.draw(np.zeros((self.height, self.width, 3), dtype=np.uint8)).astype(np.float32)
+        white = self.draw(np.full((self.height, self.width, 3), 255, dtype=np.uint8)).astype(np.float32)
+        alpha = 1 - (white - black).mean(axis=2, keepdims=True) / 255
+        color = np.divide(black, alpha, out=np.zeros_like(black), where=alpha > 0)
+        return np.dstack([np.clip(np.rint(color), 0, 255), np.rint(alpha * 255)]).astype(np.uint8)
+
+    def apply(self, image):
+        values = image.reshape(-1)
+        values[self.indices] = (values[self.indices] * self.inverse_alpha + self.color) // 255
+        return image
+
+
+grid_templates = {}
+
+
+def get_grid_template(width, height, template_dir=None):
+    # templates are kept in memory for the lifetime of the process and, if template_dir is given, also saved as PNG
+    # files so later runs on the same resolution skip drawing the grid
+    key = width, height
+    if key in grid_templates:
+        return grid_templates[key]
+    template_path = os.path.join(template_dir, f"grid_{width}x{height}.png") if template_dir else None
+    overlay = None
+    if template_path and os.path.exists(template_path):
+        overlay = cv2.imread(template_path, cv2.IMREAD_UNCHANGED)
+        if overlay is None or overlay.shape != (height, width, 4):
+            overlay = None
+    template = GridTemplate(width, height, overlay)
+    if template_path and overlay is None:
+        os.makedirs(template_dir, exist_ok=True)
+        cv2.imwrite(template_path, template.overlay)
+    grid_templates[key] = template
+    return template
+
+
+def draw_grid(img, output_path, template_dir=None):
+    image = load_image(img)
+    height, width, _ = image.shape
+    template = get_grid_template(width, height, template_dir)
+    grid = MemoryImage(template.apply(image))
+    if output_path:
+        grid.save(output_path)
+    return grid, template.rows, template.cols
+
+
+default_image_encoder = ImageEncoder()
+
+
+def encode_image(image, encoder=None):
+    # accepts a file path or a MemoryImage and returns its EncodedImage, by default the PNG as it was captured
+    encoder = encoder or default_image_encoder
+    if not isinstance(image, MemoryImage):
+        image = MemoryImage.from_file(image)
+    return image.get_encoded(encoder)
@@ -1,6 +1,5 @@
 import base64
 import cv2
-import pyshine as ps
 
 from colorama import Fore, Style
 